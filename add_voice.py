@@ -1,6 +1,32 @@
 import os
 import subprocess
 from pathlib import Path
+from config import DEDUP_SLIDES
+from ffmpeg_runner import run_ffmpeg, encode_threads
+from slide_dedup import DedupIndex, file_digest
+
+# 讲稿音频的查找顺序：无损WAV优先
+VOICE_EXTENSIONS = (".wav", ".mp3")
+
+def find_voice_file(audio_dir, stem):
+    """查找某页的讲稿音频（page_N.wav 或 page_N.mp3），找不到返回None"""
+    for ext in VOICE_EXTENSIONS:
+        audio_path = Path(audio_dir) / f"{stem}{ext}"
+        if audio_path.exists():
+            return audio_path
+    return None
+
+def segment_extension(audio_path):
+    """带音频单页片段的容器：PCM音频使用可直接存放PCM的mov容器"""
+    return ".mov" if Path(audio_path).suffix.lower() == ".wav" else ".mp4"
+
+def audio_codec_args(audio_path):
+    """
+    单页片段的音频编码参数：WAV保持PCM无损（最终合并时才编码AAC），MP3转为AAC
+    """
+    if Path(audio_path).suffix.lower() == ".wav":
+        return ["-c:a", "pcm_s16le"]
+    return ["-c:a", "aac"]
 
 def merge_video_audio(video_dir="temp/video", audio_dir="voice",output_dir="video"):
     """ 
@@ -10,15 +36,17 @@ def merge_video_audio(video_dir="temp/video", audio_dir="voice",output_dir="vide
     # 1. 获取所有视频
     video_files = [f for f in Path(video_dir).glob("page_*.mp4")]
     print(f"找到 {len(video_files)} 个视频文件")
+    # 视频与音频内容都相同的页只合并一次
+    merge_index = DedupIndex("音视频合并去重")
     
     for video_path in video_files:
         # 2. 提取页码
         slide_num = video_path.stem.split('_')[-1]
         
         # 3. 查找对应音频
-        audio_path = Path(audio_dir) / f"page_{slide_num}.mp3"
+        audio_path = find_voice_file(audio_dir, f"page_{slide_num}")
         
-        if not audio_path.exists():
+        if audio_path is None:
             print(f"跳过 {video_path.name}：未找到对应音频")
             continue
         
@@ -34,8 +62,16 @@ def merge_video_audio(video_dir="temp/video", audio_dir="voice",output_dir="vide
         
         print(f"  视频: {video_duration:.1f}秒, 音频: {audio_duration:.1f}秒")
         
-        # 5. 输出路径（新建文件）
-        output_path = Path(output_dir) / f"{video_path.stem}.mp4"
+        # 5. 输出路径（新建文件；PCM音频使用mov容器，并清理另一种容器的旧片段）
+        output_path = Path(output_dir) / f"{video_path.stem}{segment_extension(audio_path)}"
+        for stale_path in Path(output_dir).glob(f"{video_path.stem}.*"):
+            if stale_path != output_path and stale_path.suffix in (".mp4", ".mov"):
+                stale_path.unlink()
+        
+        key = (file_digest(video_path), file_digest(audio_path)) if DEDUP_SLIDES else None
+        if key and merge_index.reuse(key, output_dir, video_path.stem):
+            print(f"  ♻️  与之前的页内容相同，直接复用")
+            continue
         
         # 6. 执行合并
         if audio_duration <= video_duration:
@@ -47,6 +83,8 @@ def merge_video_audio(video_dir="temp/video", audio_dir="voice",output_dir="vide
         
         if success:
             print(f"  ✅ 完成: {output_path.name}")
+            if key:
+                merge_index.add(key, output_path)
             # 验证结果
             result_duration = get_duration(output_path)
             if result_duration:
@@ -54,18 +92,19 @@ def merge_video_audio(video_dir="temp/video", audio_dir="voice",output_dir="vide
         else:
             print(f"  ❌ 失败")
     
+    merge_index.report()
     print(f"\n处理完成！")
     return True
 
 def get_duration(file_path):
     """获取媒体文件时长（秒）"""
     try:
-        result = subprocess.run([
+        result = run_ffmpeg([
             "ffprobe", "-v", "error",
             "-show_entries", "format=duration",
             "-of", "default=noprint_wrappers=1:nokey=1",
             str(file_path)
-        ], capture_output=True, text=True)
+        ], threads=0, capture_output=True, text=True)
         return float(result.stdout.strip()) if result.returncode == 0 else None
     except:
         return None
@@ -77,12 +116,12 @@ def simple_merge(video_path, audio_path, output_path):
         "-i", str(video_path),
         "-i", str(audio_path),
         "-c:v", "copy",
-        "-c:a", "aac",
+        *audio_codec_args(audio_path),
         "-shortest",
         str(output_path)
     ]
     
-    result = subprocess.run(cmd, capture_output=True)
+    result = run_ffmpeg(cmd, capture_output=True)
     return result.returncode == 0
 
 def extend_with_last_frame_simple(video_path, audio_path, output_path, audio_duration):
@@ -107,14 +146,16 @@ def extend_with_last_frame_simple(video_path, audio_path, output_path, audio_dur
             "-vf", f"tpad=stop_mode=clone:stop_duration={extend_time}",
             "-af", "apad",  # 为音频添加静音填充（保持同步）
             "-c:v", "libx264",
-            "-c:a", "aac",
+            *audio_codec_args(audio_path),
             "-pix_fmt", "yuv420p",
             "-shortest",
+            # 显式限定时长：apad 输出无限长，PCM 编码时 -shortest 无法及时截断
+            "-t", str(audio_duration),
             str(output_path)
         ]
         
         # 运行命令，不捕获输出（避免冲突）
-        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        result = run_ffmpeg(cmd, threads=encode_threads(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
         
         if result.returncode == 0:
             return True
@@ -142,7 +183,7 @@ def extend_with_last_frame_alternative(video_path, audio_path, output_path, audi
             "-q:v", "1",
             last_frame
         ]
-        subprocess.run(cmd1, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        run_ffmpeg(cmd1, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         
         # 2. 获取视频时长
         video_duration = get_duration(video_path)
@@ -160,7 +201,7 @@ def extend_with_last_frame_alternative(video_path, audio_path, output_path, audi
             "-pix_fmt", "yuv420p",
             extended
         ]
-        subprocess.run(cmd2, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        run_ffmpeg(cmd2, threads=encode_threads(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         
         # 4. 拼接视频（先不带音频）
         concat_list = "concat.txt"
@@ -178,7 +219,7 @@ def extend_with_last_frame_alternative(video_path, audio_path, output_path, audi
             "-an",
             temp_video
         ]
-        subprocess.run(cmd3, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        run_ffmpeg(cmd3, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         
         # 5. 添加音频
         cmd4 = [
@@ -190,7 +231,7 @@ def extend_with_last_frame_alternative(video_path, audio_path, output_path, audi
             "-shortest",
             str(output_path)
         ]
-        result = subprocess.run(cmd4, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        result = run_ffmpeg(cmd4, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
         
         # 清理
         for f in [last_frame, extended, concat_list, temp_video]:
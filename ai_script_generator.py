@@ -4,24 +4,18 @@ AI讲稿生成模块 - 调用硅基流动API生成每页讲稿
 参考硅基流动API调用方法[citation:3]
 """
 
+import re
 import requests
 import json
 import os
-from config import SILICONFLOW_API_KEY, SILICONFLOW_API_URL, SCRIPT_DIR
+from config import SILICONFLOW_API_KEY, SILICONFLOW_API_URL, SCRIPT_DIR, SCRIPT_SOURCE
+from ppt_parser import extract_notes_text
 
-def generate_ai_script(ppt_text):
-    """
-    调用AI生成每页PPT的讲稿
-    
-    参数:
-        ppt_text: 格式化的PPT文本
-    
-    返回:
-        bool: 是否成功生成讲稿
-    """
-    
-    # 构建提示词 - 包含角色定义、任务描述、约束条件和格式要求[citation:9]
-    prompt = f"""
+SCRIPT_SOURCES = ("llm", "notes", "notes-else-llm")
+
+def build_prompt(ppt_text):
+    """构建提示词 - 包含角色定义、任务描述、约束条件和格式要求[citation:9]"""
+    return f"""
     你是一位资深的专业老师，需要根据以下PPT内容为每一页撰写简短的课堂讲稿。
     
     PPT内容：
@@ -38,6 +32,88 @@ def generate_ai_script(ppt_text):
     
     注意：只返回上述格式的内容，不要添加任何额外说明。
     """
+
+# PPT文本每页一行“第N页：文字内容”（见 ppt_parser），只取页码，不做讲稿字数检查
+PPT_PAGE_PATTERN = re.compile(r'^第(\d+)页：')
+
+def ppt_text_page(line):
+    """PPT文本行的页码；不是“第N页：”开头时返回None"""
+    match = PPT_PAGE_PATTERN.match(line.strip())
+    return int(match.group(1)) if match else None
+
+def filter_ppt_text(ppt_text, pages):
+    """只保留指定页码的“第N页：”文本行"""
+    return "\n".join(line for line in ppt_text.split('\n') if ppt_text_page(line) in pages)
+
+def list_text_pages(ppt_text):
+    """返回PPT文本中出现的页码"""
+    return [page for page in map(ppt_text_page, ppt_text.split('\n')) if page is not None]
+
+def generate_scripts(ppt_path, ppt_text, source=SCRIPT_SOURCE, stream=False, on_page_script=None):
+    """
+    按讲稿来源策略生成每页讲稿
+
+    参数:
+        ppt_path: PPT文件路径（用于读取演讲者备注）
+        ppt_text: 格式化的PPT文本
+        source: llm / notes / notes-else-llm
+        stream, on_page_script: 同 generate_ai_script；备注页同样会回调 on_page_script
+
+    返回:
+        bool: 是否成功生成讲稿
+    """
+    if source not in SCRIPT_SOURCES:
+        print(f"错误：未知的讲稿来源 {source}（可选: {', '.join(SCRIPT_SOURCES)}）")
+        return False
+
+    if source == "llm":
+        return generate_ai_script(ppt_text, stream=stream, on_page_script=on_page_script)
+
+    # 备注直接从PPT包中读取，无需网络请求
+    os.makedirs(SCRIPT_DIR, exist_ok=True)
+    notes = extract_notes_text(ppt_path)
+    for page_num, script in sorted(notes.items()):
+        save_page_script(page_num, script)
+        if on_page_script:
+            on_page_script(page_num, script)
+    print(f"使用演讲者备注: {len(notes)} 页")
+
+    if source == "notes":
+        if not notes:
+            print("错误：PPT中没有演讲者备注")
+            return False
+        return True
+
+    # notes-else-llm：只把没有备注的页交给AI
+    missing_pages = [page for page in list_text_pages(ppt_text) if page not in notes]
+    if not missing_pages:
+        print("所有页均有备注，跳过AI生成")
+        return bool(notes)
+
+    print(f"无备注的页交给AI生成: {missing_pages}")
+    return generate_ai_script(
+        filter_ppt_text(ppt_text, missing_pages),
+        stream=stream,
+        on_page_script=on_page_script,
+        pages=missing_pages
+    )
+
+def generate_ai_script(ppt_text, stream=False, on_page_script=None, pages=None):
+    """
+    调用AI生成每页PPT的讲稿
+    
+    参数:
+        ppt_text: 格式化的PPT文本
+        stream: 是否以SSE流式接收，每页讲稿一生成就立即保存
+        on_page_script: 流式模式下每页讲稿完成时的回调 on_page_script(页码, 讲稿)，
+                        可直接把讲稿送入语音合成队列
+        pages: 只保存这些页码的讲稿（None表示全部），避免覆盖已由备注生成的讲稿
+    
+    返回:
+        bool: 是否成功生成讲稿
+    """
+    
+    prompt = build_prompt(ppt_text)
     
     # 准备API请求数据[citation:3]
     headers = {
@@ -54,6 +130,10 @@ def generate_ai_script(ppt_text):
         "temperature": 0.7
     }
     
+    if stream:
+        data["stream"] = True
+        return generate_ai_script_stream(headers, data, on_page_script, pages)
+    
     try:
         # 调用硅基流动API[citation:3]
         response = requests.post(SILICONFLOW_API_URL, headers=headers, json=data)
@@ -63,7 +143,7 @@ def generate_ai_script(ppt_text):
         script_content = ai_response["choices"][0]["message"]["content"]
         
         # 验证返回格式并提取讲稿
-        if not validate_and_extract_script(script_content):
+        if not validate_and_extract_script(script_content, pages):
             print("错误：AI返回的格式不符合要求")
             return False
         
@@ -76,12 +156,129 @@ def generate_ai_script(ppt_text):
         print(f"解析AI响应失败: {e}")
         return False
 
-def validate_and_extract_script(ai_response):
+def generate_ai_script_stream(headers, data, on_page_script=None, pages=None):
+    """
+    以SSE流式接收AI讲稿，逐行解析，每页讲稿所在行一结束就保存并回调
+
+    返回:
+        bool: 是否至少生成了一页讲稿
+    """
+    os.makedirs(SCRIPT_DIR, exist_ok=True)
+    parser = ScriptLineParser()
+    page_count = 0
+
+    def emit(new_pages):
+        nonlocal page_count
+        for page_num, script in new_pages:
+            if pages is not None and page_num not in pages:
+                continue
+            save_page_script(page_num, script)
+            page_count += 1
+            if on_page_script:
+                on_page_script(page_num, script)
+
+    try:
+        with requests.post(SILICONFLOW_API_URL, headers=headers, json=data, stream=True) as response:
+            response.raise_for_status()
+            # SSE固定为UTF-8，响应头未声明字符集时requests会按ISO-8859-1解码
+            response.encoding = 'utf-8'
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                if not chunk.get("choices"):
+                    continue
+                # 推理模型的思考过程在 reasoning_content 中，只解析正式回答
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    emit(parser.feed(delta))
+        emit(parser.flush())
+    except requests.exceptions.RequestException as e:
+        print(f"API调用失败: {e}")
+        return False
+    except (ValueError, KeyError, IndexError) as e:
+        print(f"解析AI响应失败: {e}")
+        return False
+
+    if page_count == 0:
+        print("错误：未找到有效的讲稿内容")
+        return False
+    return True
+
+class ScriptLineParser:
+    """增量行解析器：累积流式文本，每遇到完整的一行就解析出其中的“第N页：”讲稿"""
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        """
+        追加一段流式文本
+
+        返回:
+            list: 本次新完成的 [(页码, 讲稿), ...]
+        """
+        self.buffer += text
+        pages = []
+        while '\n' in self.buffer:
+            line, self.buffer = self.buffer.split('\n', 1)
+            page = self._parse(line)
+            if page:
+                pages.append(page)
+        return pages
+
+    def flush(self):
+        """流结束时解析最后一行（可能没有换行符）"""
+        line, self.buffer = self.buffer, ""
+        page = self._parse(line)
+        return [page] if page else []
+
+    def _parse(self, line):
+        try:
+            return parse_script_line(line)
+        except (ValueError, IndexError):
+            print(f"格式错误的行: {line.strip()}")
+            return None
+
+def parse_script_line(line):
+    """
+    解析一行“第N页：讲稿”
+
+    返回:
+        (int, str): 页码和讲稿；不是讲稿行时返回None
+    """
+    line = line.strip()
+    if not (line.startswith('第') and '页：' in line):
+        return None
+
+    # 提取页码和讲稿内容
+    page_part, script_part = line.split('：', 1)
+    page_num = int(page_part.replace('第', '').replace('页', ''))
+    
+    # 检查字数限制
+    if len(script_part) > 50:
+        print(f"警告：第{page_num}页讲稿超过50字")
+        # script_part = script_part[:50]  # 截断超长部分
+    
+    return page_num, script_part
+
+def save_page_script(page_num, script):
+    """保存单页讲稿为单独文件"""
+    script_file = os.path.join(SCRIPT_DIR, f"page_{page_num}.txt")
+    with open(script_file, 'w', encoding='utf-8') as f:
+        f.write(script)
+    print(f"已保存第{page_num}页讲稿: {script[:30]}...")
+
+def validate_and_extract_script(ai_response, pages=None):
     """
     验证AI返回的格式并提取每页讲稿保存为单独文件
     
     参数:
         ai_response: AI返回的文本
+        pages: 只保存这些页码的讲稿（None表示全部）
     
     返回:
         bool: 格式是否有效
@@ -93,22 +290,16 @@ def validate_and_extract_script(ai_response):
     page_scripts = {}
     
     for line in lines:
-        line = line.strip()
-        if line.startswith('第') and '页：' in line:
-            try:
-                # 提取页码和讲稿内容
-                page_part, script_part = line.split('：', 1)
-                page_num = int(page_part.replace('第', '').replace('页', ''))
-                
-                # 检查字数限制
-                if len(script_part) > 50:
-                    print(f"警告：第{page_num}页讲稿超过50字")
-                    # script_part = script_part[:50]  # 截断超长部分
-                
-                page_scripts[page_num] = script_part
-            except (ValueError, IndexError):
-                print(f"格式错误的行: {line}")
-                return False
+        try:
+            page = parse_script_line(line)
+        except (ValueError, IndexError):
+            print(f"格式错误的行: {line.strip()}")
+            return False
+        if page:
+            page_num, script_part = page
+            if pages is not None and page_num not in pages:
+                continue
+            page_scripts[page_num] = script_part
     
     if not page_scripts:
         print("错误：未找到有效的讲稿内容")
@@ -116,9 +307,6 @@ def validate_and_extract_script(ai_response):
     
     # 保存每页讲稿为单独文件
     for page_num, script in page_scripts.items():
-        script_file = os.path.join(SCRIPT_DIR, f"page_{page_num}.txt")
-        with open(script_file, 'w', encoding='utf-8') as f:
-            f.write(script)
-        print(f"已保存第{page_num}页讲稿: {script[:30]}...")
+        save_page_script(page_num, script)
     
-    return True
\ No newline at end of file
+    return True
@@ -0,0 +1,475 @@
+# 动画合成引擎
+"""
+动画合成引擎 - 以NumPy数组表示画面，每个元素的预乘RGBA只计算一次，
+渐显（fade）、擦除（wipe）、飞入（fly）帧都只在元素所在区域内做向量化混合；
+已完成入场的元素烘焙进底图，没有动画进行时直接复用底图；
+元素位图可以延迟到入场时才加载，烘焙后立即释放，单页常驻内存只与同时在场的元素有关；
+帧缓冲来自跨页复用的缓冲池，合成结果以 memoryview 直接写入FFmpeg的stdin，不再逐帧写PNG
+
+用法:
+    python animation_engine.py                # 1080p30 合成速度基准测试
+"""
+
+import sys
+import time
+import threading
+import tracemalloc
+import subprocess
+from collections import defaultdict
+import numpy as np
+
+# 支持的入场效果：appear（直接出现）、fade（渐显）、wipe（自左向右擦除）、fly（自底部飞入）
+EFFECTS = ("appear", "fade", "wipe", "fly")
+
+# 元素每像素常驻字节数：透明度（float32）+ 预乘颜色（3×float32）+ 混合临时缓冲（3×float32）
+SPRITE_BYTES_PER_PIXEL = 4 + 12 + 12
+# 加载元素时的临时开销：RGBA转float32（4×float32）
+SPRITE_LOAD_BYTES_PER_PIXEL = 16
+# 编码器（FFmpeg/x264 子进程）内存估算：约 48 帧 yuv420p（前瞻 + 参考帧）
+ENCODER_BYTES_PER_PIXEL = 48 * 1.5
+
+def ease_out(t):
+    """三次缓出曲线，飞入结束时减速"""
+    return 1.0 - (1.0 - t) ** 3
+
+class Sprite:
+    """预处理后的元素：预乘颜色与透明度（float32），以及最终位置"""
+
+    def __init__(self, rgba, x, y, size=None):
+        """
+        参数:
+            rgba: RGBA图片（PIL.Image 或 HxWx4 的uint8数组），已缩放到目标尺寸；
+                  也可以是返回这样图片的函数，此时位图在入场时才加载、烘焙进底图后释放
+            x, y: 元素左上角在画面中的位置（像素）
+            size: (宽, 高)，延迟加载时必须给出，用于在加载前估算内存
+        """
+        self.x = int(x)
+        self.y = int(y)
+        self.alpha = self.premul = self._scratch = None
+        self._loader = rgba if callable(rgba) else None
+        if self._loader is None:
+            self._decode(rgba)
+        else:
+            self.width, self.height = size
+
+    def _decode(self, rgba):
+        rgba = np.asarray(rgba, dtype=np.float32)
+        self.alpha = rgba[..., 3:4] / np.float32(255)
+        self.premul = rgba[..., :3] * self.alpha
+        self.height, self.width = rgba.shape[:2]
+        # 混合用的临时缓冲区，按元素尺寸预先分配，逐帧复用
+        self._scratch = np.empty((self.height, self.width, 3), dtype=np.float32)
+
+    @property
+    def loaded(self):
+        return self.alpha is not None
+
+    @property
+    def nbytes(self):
+        """加载后常驻内存的估算字节数"""
+        return self.width * self.height * SPRITE_BYTES_PER_PIXEL
+
+    def load(self):
+        """延迟加载的元素在这里解码位图（已加载时不做任何事）"""
+        if self.alpha is None:
+            self._decode(self._loader())
+
+    def release(self):
+        """释放延迟加载元素的位图（之后可再次 load）；直接传入位图的元素不释放"""
+        if self._loader is not None:
+            self.alpha = self.premul = self._scratch = None
+
+class FrameBufferPool:
+    """
+    帧缓冲池：按形状复用整帧大小的uint8数组，同分辨率的各页之间不再重复分配
+    """
+
+    def __init__(self):
+        self.free = defaultdict(list)
+        self.allocations = 0
+        self.acquires = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, shape):
+        """取出一个指定形状的缓冲区（内容未初始化）"""
+        with self._lock:
+            self.acquires += 1
+            if self.free[shape]:
+                return self.free[shape].pop()
+            self.allocations += 1
+        return np.empty(shape, dtype=np.uint8)
+
+    def release(self, buffer):
+        """归还缓冲区，调用方之后不能再使用它"""
+        with self._lock:
+            self.free[buffer.shape].append(buffer)
+
+# 进程内共享的帧缓冲池
+FRAME_POOL = FrameBufferPool()
+
+class Animation:
+    """一个元素的入场动画：从 start_frame 开始，持续 duration_frames 帧"""
+
+    def __init__(self, sprite, effect="fade", start_frame=0, duration_frames=15):
+        if effect not in EFFECTS:
+            raise ValueError(f"未知的动画效果: {effect}（可选: {', '.join(EFFECTS)}）")
+        self.sprite = sprite
+        self.effect = effect
+        self.start_frame = start_frame
+        self.duration_frames = 1 if effect == "appear" else max(1, duration_frames)
+
+    @property
+    def end_frame(self):
+        """动画结束后的第一帧（从这一帧起元素完全显示）"""
+        return self.start_frame + self.duration_frames
+
+    def progress(self, frame_index):
+        """动画进度 (0, 1]；第一帧即显示部分效果"""
+        return min(1.0, (frame_index - self.start_frame + 1) / self.duration_frames)
+
+def blend_sprite(frame, sprite, x, y, opacity=1.0, visible_width=None):
+    """
+    把元素混合进画面（就地修改 frame），只处理与画面相交的区域，返回写入的字节数
+
+    参数:
+        frame: HxWx3 的uint8画面
+        sprite: Sprite
+        x, y: 本帧元素左上角位置
+        opacity: 整体不透明度
+        visible_width: 只显示元素左侧若干列（擦除效果）
+    """
+    frame_height, frame_width = frame.shape[:2]
+    width = sprite.width if visible_width is None else min(sprite.width, visible_width)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, frame_width), min(y + sprite.height, frame_height)
+    if x0 >= x1 or y0 >= y1 or opacity <= 0:
+        return 0
+
+    sx0, sy0 = x0 - x, y0 - y
+    sx1, sy1 = sx0 + (x1 - x0), sy0 + (y1 - y0)
+    dst = frame[y0:y1, x0:x1]
+    scratch = sprite._scratch[sy0:sy1, sx0:sx1]
+
+    # out = dst * (1 - alpha * opacity) + premul * opacity = dst + opacity * (premul - alpha * dst)
+    np.multiply(sprite.alpha[sy0:sy1, sx0:sx1], dst, out=scratch)
+    np.subtract(sprite.premul[sy0:sy1, sx0:sx1], scratch, out=scratch)
+    if opacity < 1:
+        scratch *= opacity
+    scratch += dst
+    scratch += 0.5
+    np.copyto(dst, scratch, casting='unsafe')
+    return dst.nbytes
+
+def draw_animation(frame, animation, frame_index):
+    """按动画进度绘制一个正在入场的元素"""
+    sprite = animation.sprite
+    progress = animation.progress(frame_index)
+    if animation.effect == "fade":
+        return blend_sprite(frame, sprite, sprite.x, sprite.y, opacity=progress)
+    if animation.effect == "wipe":
+        return blend_sprite(frame, sprite, sprite.x, sprite.y, visible_width=int(np.ceil(sprite.width * progress)))
+    if animation.effect == "fly":
+        frame_height = frame.shape[0]
+        offset = (frame_height - sprite.y) * (1.0 - ease_out(progress))
+        return blend_sprite(frame, sprite, sprite.x, sprite.y + int(round(offset)))
+    return blend_sprite(frame, sprite, sprite.x, sprite.y)
+
+def animation_events(animations, total_frames):
+    """
+    按帧号顺序给出有事件的帧：(帧号, 本帧结束入场的动画, 本帧开始入场的动画)
+    """
+    starting = defaultdict(list)
+    ending = defaultdict(list)
+    for animation in animations:
+        starting[animation.start_frame].append(animation)
+        ending[animation.end_frame].append(animation)
+    for frame_index in sorted(set(starting) | set(ending)):
+        if frame_index < total_frames:
+            yield frame_index, ending.get(frame_index, []), starting.get(frame_index, [])
+
+def settled_layers(animations, completed, floor_layers):
+    """
+    从第 floor_layers 层起，返回已经可以永久烘焙进背景的层数：
+    只有下方所有图层都已完成入场时，元素才不会再被重新绘制
+    """
+    while floor_layers < len(animations) and animations[floor_layers] in completed:
+        floor_layers += 1
+    return floor_layers
+
+def peak_sprite_bytes(animations, total_frames):
+    """
+    按动画时间轴模拟延迟加载与释放，返回同时常驻的元素位图峰值字节数（不解码任何图片）
+    """
+    completed = set()
+    loaded = set()
+    floor_layers = 0
+    peak = sum(animation.sprite.nbytes for animation in animations if animation.sprite.loaded)
+    for _, ended, started in animation_events(animations, total_frames):
+        completed.update(ended)
+        settled = settled_layers(animations, completed, floor_layers)
+        loaded.difference_update(animations[floor_layers:settled])
+        floor_layers = settled
+        loaded.update(started)
+        peak = max(peak, sum(animation.sprite.nbytes for animation in loaded))
+    return peak
+
+def estimate_render_bytes(width, height, animations, total_frames):
+    """
+    估算渲染一页动画的内存峰值（字节）：背景解码、帧缓冲、同时常驻的元素位图，
+    加载元素时的临时开销，以及编码子进程
+
+    参数:
+        width, height: 画面尺寸
+        animations: [Animation, ...]（延迟加载的元素不会被解码）
+        total_frames: 总帧数
+    """
+    pixels = width * height
+    # PIL 的RGB图按每像素4字节存放，转为数组再复制一份；另有 底图/基准图/工作帧 三个帧缓冲
+    frame_bytes = pixels * 4 + pixels * 3 + 3 * pixels * 3
+    load_bytes = max([animation.sprite.width * animation.sprite.height * SPRITE_LOAD_BYTES_PER_PIXEL
+                      for animation in animations] + [0])
+    return int(frame_bytes + peak_sprite_bytes(animations, total_frames) + load_bytes
+               + pixels * ENCODER_BYTES_PER_PIXEL)
+
+class AnimationRenderer:
+    """
+    逐帧合成器：底图 = 背景 + 已完成入场的元素（按图层顺序），只在有元素完成入场时重建；
+    每帧只需复制底图并绘制正在入场的元素，没有动画进行时直接输出底图。
+    下方图层都已完成入场的元素会永久烘焙进背景并释放位图，因此背景缓冲会被就地修改，
+    每个渲染器只能生成一遍帧序列
+    """
+
+    def __init__(self, background, animations, total_frames, pool=FRAME_POOL):
+        """
+        参数:
+            background: 背景图（PIL.Image 或 HxWx3 的uint8数组）
+            animations: [Animation, ...]，列表顺序即图层顺序（后面的在上层）
+            total_frames: 总帧数
+            pool: 帧缓冲池（底图与工作帧从池中取，渲染结束后归还）
+        """
+        if hasattr(background, "convert"):
+            background = background.convert("RGB")
+        background = np.asarray(background, dtype=np.uint8)
+        self.height, self.width = background.shape[:2]
+        self.animations = animations
+        self.total_frames = total_frames
+        self.pool = pool
+        pool_allocations = pool.allocations
+        self.background = pool.acquire(background.shape)
+        np.copyto(self.background, background)
+        self.base = pool.acquire(background.shape)
+        np.copyto(self.base, self.background)
+        self.frame = pool.acquire(background.shape)
+        self.buffer_allocations = pool.allocations - pool_allocations
+        # 已烘焙进背景缓冲的图层数（图层顺序的前缀）
+        self.floor_layers = 0
+        self.base_rebuilds = 0
+        self.composited_frames = 0
+        # 合成过程中复制/写入的像素字节数（不含送往编码器的管道写入）
+        self.bytes_copied = 0
+        # 当前常驻与峰值的元素位图字节数
+        self.sprite_bytes = sum(animation.sprite.nbytes for animation in animations if animation.sprite.loaded)
+        self.peak_sprite_bytes = self.sprite_bytes
+
+    def close(self):
+        """把帧缓冲归还缓冲池，并释放仍在内存中的延迟加载元素"""
+        for buffer in (self.background, self.base, self.frame):
+            self.pool.release(buffer)
+        self.background = self.base = self.frame = None
+        for animation in self.animations:
+            animation.sprite.release()
+
+    def _load(self, sprite):
+        if not sprite.loaded:
+            sprite.load()
+            self.sprite_bytes += sprite.nbytes
+            self.peak_sprite_bytes = max(self.peak_sprite_bytes, self.sprite_bytes)
+
+    def _settle(self, completed):
+        """把下方图层都已完成的元素永久烘焙进背景，并释放其位图"""
+        settled = settled_layers(self.animations, completed, self.floor_layers)
+        for animation in self.animations[self.floor_layers:settled]:
+            sprite = animation.sprite
+            self.bytes_copied += blend_sprite(self.background, sprite, sprite.x, sprite.y)
+            if sprite._loader is not None:
+                sprite.release()
+                self.sprite_bytes -= sprite.nbytes
+        self.floor_layers = settled
+
+    def _rebuild_base(self, completed):
+        self._settle(completed)
+        np.copyto(self.base, self.background)
+        self.bytes_copied += self.base.nbytes
+        for animation in self.animations[self.floor_layers:]:
+            if animation in completed:
+                self.bytes_copied += blend_sprite(self.base, animation.sprite, animation.sprite.x, animation.sprite.y)
+        self.base_rebuilds += 1
+
+    def frames(self):
+        """
+        生成每一帧画面
+
+        注意：返回的数组在下一帧会被复用，调用方需在取下一帧前用完
+        """
+        # 只在事件边界（有动画开始或结束的帧）更新状态，合成次数与事件数成正比
+        events = {frame_index: (ended, started)
+                  for frame_index, ended, started in animation_events(self.animations, self.total_frames)}
+        layer = {animation: index for index, animation in enumerate(self.animations)}
+
+        completed = set()
+        active = []
+        for frame_index in range(self.total_frames):
+            if frame_index in events:
+                ended, started = events[frame_index]
+                if ended:
+                    for animation in ended:
+                        if animation in active:
+                            active.remove(animation)
+                        completed.add(animation)
+                    self._rebuild_base(completed)
+                if started:
+                    for animation in started:
+                        self._load(animation.sprite)
+                    active.extend(started)
+                    active.sort(key=layer.get)
+
+            if not active:
+                yield self.base
+                continue
+
+            np.copyto(self.frame, self.base)
+            self.bytes_copied += self.frame.nbytes
+            for animation in active:
+                self.bytes_copied += draw_animation(self.frame, animation, frame_index)
+            self.composited_frames += 1
+            yield self.frame
+
+def write_frame(stream, frame):
+    """以 memoryview 把整帧写入无缓冲的流，处理部分写入，不产生中间拷贝"""
+    view = memoryview(frame).cast("B")
+    while view:
+        written = stream.write(view)
+        view = view[written:]
+
+def encode_frames(frames, width, height, output_path, fps=30, duration=None, on_progress=None):
+    """
+    把原始RGB帧经stdin送入FFmpeg编码为H.264
+
+    参数:
+        duration: 视频时长（秒），用于进度百分比
+        on_progress: 编码进度回调（见 ffmpeg_runner.ProgressTracker）
+
+    返回:
+        bool: 是否成功
+    """
+    cmd = [
+        "ffmpeg", "-y",
+        "-f", "rawvideo",
+        "-pix_fmt", "rgb24",
+        "-s", f"{width}x{height}",
+        "-framerate", str(fps),
+        "-i", "pipe:0",
+        # yuv420p 要求宽高为偶数
+        "-vf", "crop=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-c:v", "libx264",
+        "-pix_fmt", "yuv420p",
+        "-r", str(fps),
+        str(output_path)
+    ]
+    # 编码时才导入（ffmpeg_runner 依赖 config），合成基准测试不需要任何配置
+    from ffmpeg_runner import FFmpegProcess, encode_threads
+
+    # 无缓冲的stdin：帧缓冲通过 memoryview 直接交给 write，不经过Python层的中间缓冲
+    with FFmpegProcess(cmd, threads=encode_threads(), duration=duration, on_progress=on_progress,
+                       stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                       bufsize=0) as process:
+        # stderr 在后台读取，避免FFmpeg输出过多时阻塞管道
+        stderr_chunks = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_reader.start()
+        try:
+            for frame in frames:
+                write_frame(process.stdin, frame)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        except BaseException:
+            # 生成帧出错（如元素图片读取失败）：先结束FFmpeg，再等待进程退出并归还槽位
+            process.kill()
+            raise
+        finally:
+            # 先在 wait 中等待编码结束（性能分析按FFmpeg耗时计入），stderr 随进程退出读完
+            process.wait()
+            stderr_reader.join()
+        stderr = b"".join(stderr_chunks)
+    if process.returncode != 0:
+        print(f"     错误信息: {stderr.decode('utf-8', errors='ignore')[-200:]}")
+        return False
+    return True
+
+def render_animation(background, animations, total_frames, output_path, fps=30, on_progress=None):
+    """
+    合成并编码一页动画视频
+
+    参数:
+        on_progress: 编码进度回调（见 ffmpeg_runner.ProgressTracker）
+
+    返回:
+        bool: 是否成功
+    """
+    renderer = AnimationRenderer(background, animations, total_frames)
+    started = time.perf_counter()
+    try:
+        success = encode_frames(renderer.frames(), renderer.width, renderer.height, output_path, fps,
+                                duration=total_frames / fps, on_progress=on_progress)
+    finally:
+        renderer.close()
+    elapsed = time.perf_counter() - started
+    print(f"     合成 {total_frames} 帧（实际混合 {renderer.composited_frames} 帧，底图重建 {renderer.base_rebuilds} 次），"
+          f"耗时 {elapsed:.2f} 秒（{total_frames / elapsed if elapsed else 0:.0f} fps，含编码）")
+    print(f"     帧缓冲：新分配 {renderer.buffer_allocations} 个（每帧 {renderer.buffer_allocations / total_frames:.2f} 次），"
+          f"每帧平均复制 {renderer.bytes_copied / total_frames / 1024:.0f} KB")
+    return success
+
+def benchmark(width=1920, height=1080, fps=30, seconds=5, element_count=6, element_size=(480, 360), effect="fade"):
+    """
+    合成速度基准测试（不含编码）：元素在整个时长内轮流入场，每帧都有动画进行
+
+    返回:
+        float: 合成帧率
+    """
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    total_frames = fps * seconds
+    slot = total_frames // element_count
+    animations = []
+    for i in range(element_count):
+        rgba = rng.integers(0, 256, (element_size[1], element_size[0], 4), dtype=np.uint8)
+        sprite = Sprite(rgba, (i * 300) % (width - element_size[0]), (i * 170) % (height - element_size[1]))
+        animations.append(Animation(sprite, effect, start_frame=i * slot, duration_frames=slot))
+
+    renderer = AnimationRenderer(background, animations, total_frames)
+    started = time.perf_counter()
+    for _ in renderer.frames():
+        pass
+    elapsed = time.perf_counter() - started
+    renderer.close()
+    rate = total_frames / elapsed
+    print(f"{effect}: {width}x{height} {total_frames} 帧，{rate:.0f} fps（实时倍数 {rate / fps:.1f}x），"
+          f"每帧复制 {renderer.bytes_copied / total_frames / 1024:.0f} KB")
+
+    # 单独统计一遍帧循环内的内存分配（tracemalloc 会拖慢速度，不计入帧率）
+    renderer = AnimationRenderer(background, animations, total_frames)
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    for _ in renderer.frames():
+        pass
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    renderer.close()
+    print(f"  帧循环内存峰值增量 {(peak - baseline) / 1024:.0f} KB（整帧 {width * height * 3 / 1024:.0f} KB）")
+    return rate
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or ["fade", "wipe", "fly"]:
+        benchmark(effect=name)
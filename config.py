@@ -85,6 +85,18 @@ XUNFEI_API_KEY = get_config('XUNFEI_API_KEY', required=True)
 XUNFEI_API_SECRET = get_config('XUNFEI_API_SECRET', required=True)
 XUNFEI_TTS_URL = get_config('XUNFEI_TTS_URL', "wss://cbm01.cn-huabei-1.xf-yun.com/v1/private/mcd9m97e6")
 
+# 流式接收AI讲稿（SSE），每页讲稿一完成就开始合成语音
+LLM_STREAM = get_config('LLM_STREAM', "false").lower() in ("1", "true", "yes")
+# 讲稿来源：llm（全部由AI生成）、notes（直接使用演讲者备注，不调用AI）、
+# notes-else-llm（有备注的页用备注，只有无备注的页才调用AI）
+SCRIPT_SOURCE = get_config('SCRIPT_SOURCE', "llm")
+
+# 讲稿音频格式：mp3（服务端返回MP3）或 pcm（返回原始PCM并保存为WAV，
+# 逐页处理全程无损，最终合并时只做一次AAC编码）
+TTS_AUDIO_FORMAT = get_config('TTS_AUDIO_FORMAT', "mp3")
+# 每次TTS请求合并的页数：大于1时多页讲稿一次合成，再按停顿精确切分为 page_N.wav
+TTS_BATCH_SIZE = int(get_config('TTS_BATCH_SIZE', "1"))
+
 # ========== 路径配置 ==========
 # 工具路径
 FFMPEG_PATH = get_config('FFMPEG_PATH', "ffmpeg")
@@ -105,6 +117,54 @@ TEMP_DIR = str(BASE_DIR / TEMP_DIR)
 IMG_DIR = str(BASE_DIR / IMG_DIR)
 TEMP_VIDEO = str(BASE_DIR / TEMP_VIDEO)
 
+# ========== 解析配置 ==========
+# PPT文本提取后端：spire（Spire.Presentation）或 lxml（直接解析幻灯片XML，速度更快）
+PPT_TEXT_BACKEND = get_config('PPT_TEXT_BACKEND', "spire")
+
+# ========== 渲染配置 ==========
+# 元素图片解码缓存上限（MB）：相同素材（按内容哈希）在所有页之间只解码、缩放一次
+IMAGE_CACHE_MB = int(get_config('IMAGE_CACHE_MB', "256"))
+# 元素入场效果：appear（直接出现）、fade（渐显）、wipe（擦除）、fly（飞入），以及动画时长（秒）
+ANIMATION_EFFECT = get_config('ANIMATION_EFFECT', "fade")
+ANIMATION_SECONDS = float(get_config('ANIMATION_SECONDS', "0.5"))
+# 提取图片时按显示区域和输出分辨率预缩放超大素材（保存为RGBA PNG），渲染阶段不再解码原图
+MEDIA_PRESCALE = get_config('MEDIA_PRESCALE', "false").lower() in ("1", "true", "yes")
+# 预缩放时是否额外保留原图（temp/img/original）
+KEEP_ORIGINAL_MEDIA = get_config('KEEP_ORIGINAL_MEDIA', "false").lower() in ("1", "true", "yes")
+# 重复页去重：讲稿相同的页只合成一次语音，画面相同的页只渲染一次，完全相同的页只编码一次
+DEDUP_SLIDES = get_config('DEDUP_SLIDES', "true").lower() in ("1", "true", "yes")
+# 背景图栅格缓存：按幻灯片及其版式、母版、媒体内容和DPI寻址，跨运行、跨任务共享
+RASTER_CACHE_DIR = str(BASE_DIR / get_config('RASTER_CACHE_DIR', "cache/rasters"))
+# 栅格缓存容量上限（MB），超出后按最近使用时间淘汰
+RASTER_CACHE_MB = int(get_config('RASTER_CACHE_MB', "1024"))
+# 同时渲染的动画页数，以及渲染阶段的内存预算（MB，含图片解码缓存，0表示不限制）：
+# 按清单估算每页内存峰值，估算之和超出预算的页排队等待
+RENDER_WORKERS = int(get_config('RENDER_WORKERS', "1"))
+RENDER_MEMORY_MB = int(get_config('RENDER_MEMORY_MB', "0"))
+# FFmpeg可同时使用的CPU槽位（默认为CPU核数），每个编码任务按线程数占用槽位，不足时排队；
+# 编码线程数默认按 RENDER_WORKERS 平分槽位（0表示自动）
+FFMPEG_CPU_SLOTS = int(get_config('FFMPEG_CPU_SLOTS', str(os.cpu_count() or 1)))
+FFMPEG_THREADS = int(get_config('FFMPEG_THREADS', "0"))
+# 每次FFmpeg调用的编码记录（耗时、输出时长、实时倍数）追加写入的JSON Lines文件，留空不写
+FFMPEG_METRICS_FILE = get_config('FFMPEG_METRICS_FILE', "")
+
+# ========== 性能分析 ==========
+# 按流程步骤输出 cProfile 结果与折叠栈火焰图数据（也可用命令行参数 --profile 开启）
+PROFILE = get_config('PROFILE', "false").lower() in ("1", "true", "yes")
+PROFILE_DIR = str(BASE_DIR / get_config('PROFILE_DIR', "profiles"))
+
+# ========== 输出配置 ==========
+# 多分辨率输出档位（逗号分隔，如 "1080p,720p,480p"），留空则只输出单一分辨率的 final_video.mp4
+RENDITIONS = get_config('RENDITIONS', "")
+# 最终输出形式：mp4（单个final_video.mp4）、hls（按页切片的fMP4/HLS）、both（两者都输出）
+OUTPUT_MODE = get_config('OUTPUT_MODE', "mp4")
+HLS_DIR = str(BASE_DIR / get_config('HLS_DIR', "hls"))
+# 增量合并：已加渐入渐出的单页片段按内容哈希持久保存，只重新编码内容变化的页
+MERGE_UPDATE = get_config('MERGE_UPDATE', "false").lower() in ("1", "true", "yes")
+SEGMENT_STORE_DIR = str(BASE_DIR / get_config('SEGMENT_STORE_DIR', "cache/segments"))
+# 片段缓存容量上限（MB），超出后按最近使用时间淘汰
+SEGMENT_STORE_MB = int(get_config('SEGMENT_STORE_MB', "2048"))
+
 # ========== 配置验证 ==========
 def validate_config():
     """验证配置是否完整"""
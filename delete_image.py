@@ -10,10 +10,12 @@ import os
 import json
 from pptx import Presentation
 from config import TEMP_DIR, IMG_DIR
+import raster_cache
 
-def run_deletion_test(json_file_path, ppt_file_path):
+def run_deletion_test(json_file_path, ppt_file_path, dpi=96):
     """
     根据 JSON 里的原始 XML ID，从 PPT 中物理删除元素
+    dpi: 背景图栅格化分辨率（多分辨率输出时按最高档位放大）
     """
     os.makedirs(TEMP_DIR, exist_ok=True)
     output_pptx = os.path.join(TEMP_DIR, "temp_ppt.pptx")
@@ -30,6 +32,7 @@ def run_deletion_test(json_file_path, ppt_file_path):
     print(f"✅ 成功加载 PPT: {ppt_file_path}")
 
     # 2. 执行基于 XML 的精准删除
+    modified_slides = set()
     for slide_data in json_data["slides"]:
         slide_num = int(slide_data["slide_number"])
         if slide_num > len(prs.slides):
@@ -47,13 +50,39 @@ def run_deletion_test(json_file_path, ppt_file_path):
                 shape_elm = cnvpr.getparent().getparent()
                 if shape_elm is not None:
                     shape_elm.getparent().remove(shape_elm)
+                    modified_slides.add(slide_num)
                     print(f"   - 第{slide_num}页: 已通过 ID {cnvpr.get('id')} 物理删除图片")
 
-    # 3. 保存
+    # 3. 按删除后的幻灯片内容查找栅格缓存，只导出未命中的页
+    os.makedirs(IMG_DIR, exist_ok=True)
+    slide_keys = {}
+    missing_slides = []
+    for slide_num, slide in enumerate(prs.slides, 1):
+        slide_keys[slide_num] = raster_cache.slide_raster_key(slide, dpi)
+        if not raster_cache.fetch(slide_keys[slide_num], os.path.join(IMG_DIR, f"page_{slide_num}.png")):
+            missing_slides.append(slide_num)
+    print(f"🗂️  栅格缓存: 命中 {len(slide_keys) - len(missing_slides)} 页，需渲染 {len(missing_slides)} 页"
+          f"（其中删除过图片元素的 {len(modified_slides.intersection(missing_slides))} 页）")
+
+    # 所有页都命中缓存时，无需保存临时PPT，也无需启动PowerPoint
+    if not missing_slides:
+        print("🚀 任务完成！所有背景图均来自栅格缓存")
+        return True
+
+    # 4. 保存
     prs.save(output_pptx)
     print("-" * 50)
     print(f"🚀 任务完成！清理后的 PPT 已存至: {output_pptx}")
-    pptx_to_images(output_pptx)
+    pptx_to_images(output_pptx, dpi=dpi, slide_numbers=missing_slides)
+    for slide_num in missing_slides:
+        image_path = os.path.join(IMG_DIR, f"page_{slide_num}.png")
+        if os.path.exists(image_path):
+            raster_cache.store(slide_keys[slide_num], image_path)
+    # 容量清理只是尽力而为，其他进程长时间占用缓存锁或文件被占用时留到下次再清理
+    try:
+        raster_cache.evict()
+    except OSError as e:
+        print(f"⚠️  跳过栅格缓存清理: {e}")
     return True
 
 if __name__ == "__main__":
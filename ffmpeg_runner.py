@@ -0,0 +1,464 @@
+# FFmpeg子进程执行模块
+"""
+FFmpeg子进程执行模块 - 所有FFmpeg调用统一从这里启动：
+按CPU槽位限制同时运行的编码任务，为每个任务显式设置 -threads / -filter_threads，
+超出槽位的任务排队等待，避免多个FFmpeg各自按全部核心开线程导致过载；
+通过 -progress pipe:1 实时解析每次调用的帧数、速度和输出时长，提供进度回调、
+预计剩余时间，并记录每次调用的编码速度（实时倍数）
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import subprocess
+from collections import deque
+
+from config import FFMPEG_PATH, FFMPEG_CPU_SLOTS, FFMPEG_THREADS, RENDER_WORKERS, FFMPEG_METRICS_FILE
+
+# 整体进度最短打印间隔（秒）
+PROGRESS_PRINT_INTERVAL = 5.0
+
+class CpuGovernor:
+    """
+    CPU槽位分配器：每个任务按线程数占用槽位，槽位不足时按提交顺序排队
+    """
+
+    def __init__(self, slots):
+        self.slots = max(1, slots)
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.jobs = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        # 槽位 × 占用秒数，用于计算利用率
+        self.busy_slot_seconds = 0.0
+        self.first_started = None
+        self.last_finished = None
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def acquire(self, slots):
+        """
+        占用槽位，不足时阻塞
+
+        返回:
+            int: 实际占用的槽位数（不超过总槽位数），归还时原样传给 release
+        """
+        slots = min(max(0, slots), self.slots)
+        if slots == 0:
+            return 0
+        with self._cond:
+            ticket = object()
+            self._queue.append(ticket)
+            started = time.perf_counter()
+            while self._queue[0] is not ticket or self.in_use + slots > self.slots:
+                self._cond.wait()
+            self._queue.popleft()
+            now = time.perf_counter()
+            if now - started > 0.001:
+                self.waits += 1
+                self.wait_seconds += now - started
+            if self.first_started is None:
+                self.first_started = now
+            self.jobs += 1
+            self.in_use += slots
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self._cond.notify_all()
+        return slots
+
+    def release(self, slots, held_seconds):
+        if slots == 0:
+            return
+        with self._cond:
+            self.in_use -= slots
+            self.busy_slot_seconds += slots * held_seconds
+            self.last_finished = time.perf_counter()
+            self._cond.notify_all()
+
+    def stats(self):
+        """返回任务数、排队与利用率统计"""
+        with self._cond:
+            elapsed = (self.last_finished or 0) - (self.first_started or 0)
+            return {
+                "slots": self.slots,
+                "jobs": self.jobs,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "waits": self.waits,
+                "wait_seconds": self.wait_seconds,
+                "utilization": self.busy_slot_seconds / (self.slots * elapsed) if elapsed > 0 else 0.0
+            }
+
+    def report(self):
+        stats = self.stats()
+        print(f"⚙️  FFmpeg调度: {stats['jobs']} 个任务，{stats['slots']} 个CPU槽位（峰值占用 {stats['peak_in_use']}），"
+              f"排队 {stats['waits']} 次共 {stats['wait_seconds']:.1f} 秒，槽位利用率 {stats['utilization']:.0%}")
+
+# 进程内所有FFmpeg任务共用一个分配器
+GOVERNOR = CpuGovernor(FFMPEG_CPU_SLOTS)
+
+def encode_threads():
+    """
+    编码任务的线程数：显式配置优先，否则按并行渲染页数平分CPU槽位
+    """
+    if FFMPEG_THREADS > 0:
+        return FFMPEG_THREADS
+    return max(1, GOVERNOR.slots // max(1, RENDER_WORKERS))
+
+def build_command(cmd, threads, outputs=None):
+    """
+    为FFmpeg命令加上线程参数：-filter_threads / -filter_complex_threads 为全局参数，
+    -threads 为输出参数，插入在每个输出文件之前
+
+    参数:
+        cmd: 以 "ffmpeg" 开头的参数列表
+        threads: 线程数，0 表示不设置
+        outputs: 输出文件路径列表，默认只有最后一个参数
+    """
+    cmd = [str(arg) for arg in cmd]
+    if cmd[0] == "ffmpeg":
+        cmd[0] = FFMPEG_PATH
+    if not threads:
+        return cmd
+
+    for output in reversed([str(path) for path in outputs] if outputs else [cmd[-1]]):
+        index = len(cmd) - 1 - cmd[::-1].index(output)
+        cmd[index:index] = ["-threads", str(threads)]
+    cmd[1:1] = ["-filter_threads", str(threads), "-filter_complex_threads", str(threads)]
+    return cmd
+
+def parse_clock(value):
+    """把 HH:MM:SS.ffffff 解析为秒数，无法解析时返回 None"""
+    match = re.match(r'(-?\d+):(\d+):(\d+(?:\.\d+)?)', value.strip())
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+def format_eta(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}" if seconds >= 3600 else f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+# 每次FFmpeg调用的编码记录，用于容量规划
+ENCODE_LOG = []
+_log_lock = threading.Lock()
+
+class ProgressTracker:
+    """
+    解析一次FFmpeg调用的 -progress 输出（key=value 行，每组以 progress=continue/end 结尾），
+    每组更新后回调一次，进程结束时记录编码速度
+    """
+
+    def __init__(self, label, duration=None, on_progress=None):
+        """
+        参数:
+            label: 本次调用的名称（默认为输出文件名）
+            duration: 预期输出时长（秒），未知时从stderr的 Duration 行推断
+            on_progress: 回调函数 on_progress(event)，event 字段见 snapshot
+        """
+        self.label = label
+        self.duration = duration
+        self.on_progress = on_progress
+        # 发起调用的线程名（性能分析时为任务名），用于把子进程耗时归属到任务
+        self.thread = threading.current_thread().name
+        self.started = time.perf_counter()
+        self.fields = {}
+        self.frame = 0
+        self.fps = None
+        self.speed = None
+        self.out_time = 0.0
+
+    def feed_stderr(self, line):
+        """从stderr中取第一个输入的时长，作为未指定 duration 时的进度基准"""
+        if self.duration is None and "Duration:" in line:
+            self.duration = parse_clock(line.split("Duration:", 1)[1]) or None
+
+    def feed(self, line):
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            return
+        if key != "progress":
+            self.fields[key] = value
+            return
+
+        fields, self.fields = self.fields, {}
+        if fields.get("frame", "").isdigit():
+            self.frame = int(fields["frame"])
+        try:
+            self.fps = float(fields["fps"])
+        except (KeyError, ValueError):
+            pass
+        speed = fields.get("speed", "").rstrip("x")
+        try:
+            self.speed = float(speed)
+        except ValueError:
+            pass
+        # out_time_ms 实际上也是微秒
+        for name in ("out_time_us", "out_time_ms"):
+            if fields.get(name, "").lstrip("-").isdigit():
+                self.out_time = max(0.0, int(fields[name]) / 1_000_000)
+                break
+        else:
+            if "out_time" in fields:
+                self.out_time = parse_clock(fields["out_time"]) or self.out_time
+        self._emit(finished=value == "end")
+
+    def snapshot(self, finished=False):
+        """当前进度：帧数、fps、速度（实时倍数）、输出时长、百分比与预计剩余时间"""
+        elapsed = time.perf_counter() - self.started
+        percent = None
+        eta = None
+        if finished:
+            percent, eta = 1.0, 0.0
+        elif self.duration:
+            percent = min(1.0, self.out_time / self.duration)
+            if self.out_time > 0:
+                eta = (self.duration - min(self.out_time, self.duration)) * elapsed / self.out_time
+        return {
+            "label": self.label,
+            "frame": self.frame,
+            "fps": self.fps,
+            "speed": self.speed,
+            "out_time": self.out_time,
+            "duration": self.duration,
+            "percent": percent,
+            "eta": eta,
+            "elapsed": elapsed,
+            "finished": finished
+        }
+
+    def _emit(self, finished=False):
+        if self.on_progress is not None:
+            self.on_progress(self.snapshot(finished))
+
+    def finish(self, returncode):
+        """进程结束：记录本次调用的耗时与编码速度（输出时长 / 墙钟时间）"""
+        wall = time.perf_counter() - self.started
+        record = {
+            "label": self.label,
+            "wall_seconds": round(wall, 3),
+            "media_seconds": round(self.out_time, 3),
+            "speed": round(self.out_time / wall, 3) if wall > 0 else None,
+            "frames": self.frame,
+            "returncode": returncode,
+            "thread": self.thread,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }
+        with _log_lock:
+            ENCODE_LOG.append(record)
+            if FFMPEG_METRICS_FILE:
+                with open(FFMPEG_METRICS_FILE, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if returncode != 0:
+            self._emit(finished=False)
+        return record
+
+def encode_report():
+    """汇总所有FFmpeg调用的编码速度"""
+    with _log_lock:
+        records = list(ENCODE_LOG)
+    if not records:
+        return
+    wall = sum(record["wall_seconds"] for record in records)
+    media = sum(record["media_seconds"] for record in records)
+    slowest = min(records, key=lambda record: record["speed"] or 0)
+    print(f"📈 FFmpeg编码: {len(records)} 次调用，输出 {media:.1f} 秒媒体，耗时 {wall:.1f} 秒，"
+          f"平均 {media / wall if wall else 0:.1f}x 实时，最慢 {slowest['label']}（{slowest['speed'] or 0:.1f}x）")
+
+class DeckProgress:
+    """
+    整体进度：把多次FFmpeg调用（每页一个或多个单元）的进度汇总为百分比和预计剩余时间
+
+    用法:
+        deck = DeckProgress("合并视频", total_units=len(pages))
+        run_ffmpeg(cmd, on_progress=deck.callback("page_1"))
+        deck.skip()      # 复用缓存、不需要调用FFmpeg的单元
+        deck.report()
+    """
+
+    def __init__(self, name, total_units):
+        self.name = name
+        self.total_units = max(1, total_units)
+        self.fractions = {}
+        self.skipped = 0
+        self.started = time.perf_counter()
+        self._last_print = 0.0
+        self._lock = threading.Lock()
+
+    def fraction(self):
+        with self._lock:
+            return min(1.0, (sum(self.fractions.values()) + self.skipped) / self.total_units)
+
+    def eta(self):
+        fraction = self.fraction()
+        if fraction <= 0:
+            return None
+        return (time.perf_counter() - self.started) * (1 - fraction) / fraction
+
+    def callback(self, label):
+        """返回某个单元的进度回调，可直接传给 run_ffmpeg/FFmpegProcess 的 on_progress"""
+        def on_progress(event):
+            with self._lock:
+                if event["finished"]:
+                    self.fractions[label] = 1.0
+                elif event["percent"] is not None:
+                    self.fractions[label] = event["percent"]
+            self._maybe_print(force=event["finished"])
+        return on_progress
+
+    def skip(self, units=1):
+        with self._lock:
+            self.skipped += units
+        self._maybe_print(force=True)
+
+    def _maybe_print(self, force=False):
+        now = time.perf_counter()
+        with self._lock:
+            if not force and now - self._last_print < PROGRESS_PRINT_INTERVAL:
+                return
+            self._last_print = now
+            done = sum(1 for value in self.fractions.values() if value >= 1.0) + self.skipped
+        print(f"  ⏳ {self.name}: {self.fraction():.0%}（{min(done, self.total_units)}/{self.total_units}），"
+              f"预计剩余 {format_eta(self.eta())}")
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        print(f"⏱️  {self.name}: {self.total_units} 个单元，耗时 {format_eta(elapsed)}")
+
+def _progress_label(cmd, outputs):
+    return os.path.basename(str(outputs[-1] if outputs else cmd[-1]))
+
+def _tracked(cmd):
+    """ffmpeg 编码/封装调用才解析进度（ffprobe、-version 等查询不解析）"""
+    return os.path.basename(cmd[0]).lower().startswith("ffmpeg") and "-version" not in cmd
+
+def _with_progress(cmd):
+    return cmd[:1] + ["-progress", "pipe:1", "-nostats"] + cmd[1:]
+
+def run_ffmpeg(cmd, threads=1, slots=None, outputs=None, duration=None, on_progress=None, **kwargs):
+    """
+    运行一次FFmpeg/FFprobe，参数与 subprocess.run 相同
+
+    FFmpeg调用的stdout固定用于 -progress 输出，stderr总是被捕获（返回值的 stderr），
+    因此 stdout / stderr / capture_output 参数会被忽略
+
+    参数:
+        cmd: 命令参数列表（"ffmpeg" 会替换为配置的 FFMPEG_PATH）
+        threads: 该任务的线程数；0 表示不加线程参数（如 ffprobe）
+        slots: 占用的CPU槽位数，默认等于线程数；0 表示不受调度限制
+        outputs: 多输出命令的各输出文件路径
+        duration: 预期输出时长（秒），用于计算百分比与预计剩余时间
+        on_progress: 进度回调，见 ProgressTracker.snapshot
+
+    返回:
+        subprocess.CompletedProcess
+    """
+    cmd = build_command(cmd, threads, outputs)
+    held = GOVERNOR.acquire(threads if slots is None else slots)
+    started = time.perf_counter()
+    try:
+        if not _tracked(cmd):
+            return subprocess.run(cmd, **kwargs)
+        tracker = ProgressTracker(_progress_label(cmd, outputs), duration, on_progress)
+        return _run_tracked(_with_progress(cmd), tracker, **kwargs)
+    finally:
+        GOVERNOR.release(held, time.perf_counter() - started)
+
+def _run_tracked(cmd, tracker, input=None, text=False, encoding=None, errors=None, check=False,
+                 stdout=None, stderr=None, capture_output=False, **kwargs):
+    text_mode = text or encoding is not None or errors is not None
+    if input is not None:
+        kwargs["stdin"] = subprocess.PIPE
+        if text_mode:
+            input = input.encode(encoding or "utf-8", errors or "strict")
+
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+    stderr_lines = []
+
+    def read_stderr():
+        for line in iter(process.stderr.readline, b""):
+            stderr_lines.append(line)
+            tracker.feed_stderr(line.decode("utf-8", errors="ignore"))
+
+    def write_stdin():
+        try:
+            process.stdin.write(input)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    helpers = [threading.Thread(target=read_stderr, daemon=True)]
+    if input is not None:
+        helpers.append(threading.Thread(target=write_stdin, daemon=True))
+    for helper in helpers:
+        helper.start()
+    for line in iter(process.stdout.readline, b""):
+        tracker.feed(line.decode("utf-8", errors="ignore"))
+    for helper in helpers:
+        helper.join()
+    returncode = process.wait()
+    tracker.finish(returncode)
+
+    stderr_output = b"".join(stderr_lines)
+    if text_mode:
+        stderr_output = stderr_output.decode(encoding or "utf-8", errors or "strict")
+    if check and returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd, None, stderr_output)
+    return subprocess.CompletedProcess(cmd, returncode, None, stderr_output)
+
+class FFmpegProcess(subprocess.Popen):
+    """
+    受调度的FFmpeg长时间进程（如经stdin持续送入数据）：创建前占用槽位，进程结束（wait）后归还；
+    stdout 用于 -progress 输出，由后台线程解析。建议以 with 使用，异常时也会结束进程并归还槽位
+    """
+
+    def __init__(self, cmd, threads=1, slots=None, outputs=None, duration=None, on_progress=None, **kwargs):
+        cmd = build_command(cmd, threads, outputs)
+        self._tracker = ProgressTracker(_progress_label(cmd, outputs), duration, on_progress)
+        kwargs["stdout"] = subprocess.PIPE
+        self._held = GOVERNOR.acquire(threads if slots is None else slots)
+        self._started = time.perf_counter()
+        self._released = False
+        try:
+            super().__init__(_with_progress(cmd), **kwargs)
+        except Exception:
+            self._release()
+            raise
+        # 进度流只由后台线程读取，不暴露为 self.stdout，避免 communicate() 与之争抢
+        stream, self.stdout = self.stdout, None
+        self._progress_reader = threading.Thread(target=self._read_progress, args=(stream,), daemon=True)
+        self._progress_reader.start()
+
+    def _read_progress(self, stream):
+        with stream:
+            for line in iter(stream.readline, b""):
+                self._tracker.feed(line.decode("utf-8", errors="ignore"))
+
+    def _release(self):
+        if not self._released:
+            self._released = True
+            GOVERNOR.release(self._held, time.perf_counter() - self._started)
+
+    def wait(self, timeout=None):
+        returncode = super().wait(timeout)
+        if not self._released:
+            self._progress_reader.join()
+            self._tracker.finish(returncode)
+        self._release()
+        return returncode
+
+    def __exit__(self, exc_type, value, traceback):
+        # 以 with 使用时异常退出也要结束进程，否则 wait() 会阻塞在仍等待stdin的FFmpeg上
+        if exc_type is not None and self.returncode is None:
+            self.kill()
+        super().__exit__(exc_type, value, traceback)
+
+    def __del__(self, *args, **kwargs):
+        # 兜底：调用方漏掉 wait() 时也归还槽位，否则之后的FFmpeg调用会一直排队
+        if getattr(self, "_released", True) is False:
+            self._release()
+        super().__del__(*args, **kwargs)
@@ -4,10 +4,137 @@ import zipfile
 import shutil
 from lxml import etree
 from pathlib import Path
+from PIL import Image
+from config import MEDIA_PRESCALE, KEEP_ORIGINAL_MEDIA
 
-def extract_only_images(pptx_path, output_json):
+def display_size(width_px, height_px, dpi=96):
+    """
+    元素在输出画面中的实际像素尺寸（与 video_generator 的缩放规则一致：按DPI放大并取偶数）
+    """
+    scale = dpi / 96
+    target_width = max(2, int(width_px * scale))
+    target_height = max(2, int(height_px * scale))
+    if target_width % 2 != 0:
+        target_width += 1
+    if target_height % 2 != 0:
+        target_height += 1
+    return target_width, target_height
+
+def save_prescaled_image(z, image_target, image_save_path, target_size):
+    """
+    素材大于显示区域时缩放为RGBA PNG保存
+
+    返回:
+        tuple: 原图尺寸 (宽, 高)；素材无需缩放或无法解码（如EMF/WMF）时返回None
+    """
+    try:
+        with z.open(image_target) as img_file:
+            img = Image.open(img_file)
+            source_size = img.size
+            if source_size[0] <= target_size[0] and source_size[1] <= target_size[1]:
+                return None
+            # JPEG 可直接按缩小比例解码，避免先完整解码大图
+            img.draft("RGB", target_size)
+            img.convert("RGBA").resize(target_size, Image.Resampling.LANCZOS).save(image_save_path, "PNG")
+            return source_size
+    except Exception:
+        return None
+
+# PowerPoint 入场效果 presetID -> 渲染器支持的效果，其余入场效果按渐显处理
+ENTRANCE_PRESETS = {"1": "appear", "2": "fly", "10": "fade", "22": "wipe"}
+# 视频中没有鼠标点击：每个“单击时”动画组在上一组结束后停顿该时长再自动开始（与原先每个元素停留18帧一致）
+CLICK_PAUSE_MS = 600
+# 动画未声明时长时的默认值
+DEFAULT_EFFECT_MS = 500
+
+def _delay_ms(ctn, ns):
+    """时间节点的开始延迟（毫秒）；"indefinite"（等待点击）等非数值返回None"""
+    delay = ctn.xpath('string(p:stCondLst/p:cond[1]/@delay)', namespaces=ns)
+    return int(delay) if delay.lstrip('-').isdigit() else None
+
+def _effect_duration_ms(effect_ctn, ns):
+    """效果的持续时长：其下所有行为节点中最晚的结束时间"""
+    duration = 0
+    for ctn in effect_ctn.xpath('.//p:cBhvr/p:cTn', namespaces=ns):
+        dur = ctn.get('dur', '')
+        if dur.isdigit():
+            duration = max(duration, (_delay_ms(ctn, ns) or 0) + int(dur))
+    return duration or DEFAULT_EFFECT_MS
+
+def parse_timing_schedule(slide_tree, ns):
+    """
+    把幻灯片的 p:timing 主序列解析为紧凑的入场事件表
+
+    “单击时”动画组依次自动播放；组内“与上一动画同时/之后”的延迟按原值计算
+
+    返回:
+        list: [{"spid", "effect", "start_ms", "duration_ms"}, ...]；没有动画时间轴时返回None
+    """
+    main_seq = slide_tree.xpath('./p:timing//p:cTn[@nodeType="mainSeq"]', namespaces=ns)
+    if not main_seq:
+        return None
+
+    events = []
+    clock = 0
+    for click_ctn in main_seq[0].xpath('p:childTnLst/p:par/p:cTn', namespaces=ns):
+        group_start = clock + max(_delay_ms(click_ctn, ns) or 0, 0)
+        group_end = group_start
+        for step_ctn in click_ctn.xpath('p:childTnLst/p:par/p:cTn', namespaces=ns):
+            step_start = group_start + max(_delay_ms(step_ctn, ns) or 0, 0)
+            for effect_ctn in step_ctn.xpath('p:childTnLst/p:par/p:cTn[@presetClass]', namespaces=ns):
+                start = step_start + max(_delay_ms(effect_ctn, ns) or 0, 0)
+                duration = _effect_duration_ms(effect_ctn, ns)
+                group_end = max(group_end, start + duration)
+                # 只处理入场效果；强调、退出、路径动画不影响元素何时出现
+                if effect_ctn.get('presetClass') != 'entr':
+                    continue
+                effect = ENTRANCE_PRESETS.get(effect_ctn.get('presetID'), "fade")
+                for spid in dict.fromkeys(effect_ctn.xpath('.//p:tgtEl/p:spTgt/@spid', namespaces=ns)):
+                    events.append({"spid": spid, "effect": effect, "start_ms": start, "duration_ms": duration})
+        clock = group_end + CLICK_PAUSE_MS
+    return events
+
+def build_slide_timeline(slide_tree, picture_ids, ns):
+    """
+    把入场事件映射到图片元素：目标是组合时，组合内的图片随组合一起入场
+
+    返回:
+        (list, int): 图片元素的时间轴 [{"id", "effect", "start_ms", "duration_ms"}, ...]（按开始时间排序），
+                     无法单独渲染的非图片动画形状数量；没有动画时间轴时时间轴为None
+    """
+    events = parse_timing_schedule(slide_tree, ns)
+    if events is None:
+        return None, 0
+
+    timeline = {}
+    skipped_shapes = 0
+    for event in events:
+        targets = slide_tree.xpath(f'.//p:cNvPr[@id="{event["spid"]}"]/../..', namespaces=ns)
+        if not targets:
+            continue
+        target_pics = [pid for pid in targets[0].xpath('descendant-or-self::p:pic/p:nvPicPr/p:cNvPr/@id', namespaces=ns)
+                       if pid in picture_ids]
+        if not target_pics:
+            # 文本框、形状等已栅格化进背景图，无法单独入场
+            skipped_shapes += 1
+            continue
+        for pic_id in target_pics:
+            # 同一图片有多个入场效果（如自身和所在组合）时以最早的为准
+            if pic_id not in timeline or event["start_ms"] < timeline[pic_id]["start_ms"]:
+                timeline[pic_id] = {
+                    "id": pic_id,
+                    "effect": event["effect"],
+                    "start_ms": event["start_ms"],
+                    "duration_ms": event["duration_ms"]
+                }
+    return sorted(timeline.values(), key=lambda e: e["start_ms"]), skipped_shapes
+
+def extract_only_images(pptx_path, output_json, prescale=MEDIA_PRESCALE, dpi=96, keep_original=KEEP_ORIGINAL_MEDIA):
     """
     仅提取 PPT 中的图片元素，过滤掉文本框、形状等，提取坐标宽高，下载并保存图片
+    prescale: 是否把超大图片预缩放到最终显示尺寸（按 a:ext 与输出DPI计算）
+    dpi: 输出画面的栅格化DPI（与背景图一致）
+    keep_original: 预缩放时是否额外保留原图
     """
     slides_data = []
     # PPT 的 XML 命名空间
@@ -47,6 +174,8 @@ def extract_only_images(pptx_path, output_json):
         
         # EMU 转换为像素的转换因子
         emu_to_px = 914400 / 96
+        prescaled_count = 0
+        skipped_shape_count = 0
         
         for slide_file in slide_files:
             slide_num = "".join(filter(str.isdigit, slide_file.split('/')[-1]))
@@ -130,6 +259,8 @@ def extract_only_images(pptx_path, output_json):
                     # 获取图片路径并保存
                     image_path = None
                     image_target = None
+                    original_path = None
+                    source_size = None
                     
                     if rid and rid in rels_dict:
                         # 获取图片在PPT中的路径
@@ -158,13 +289,30 @@ def extract_only_images(pptx_path, output_json):
                             image_save_path = os.path.join(temp_img_dir, image_filename)
                             
                             try:
-                                # 从ZIP包中提取图片
-                                with z.open(image_target) as img_file:
-                                    with open(image_save_path, 'wb') as out_file:
-                                        shutil.copyfileobj(img_file, out_file)
+                                if prescale:
+                                    scaled_filename = f"slide{slide_num}_pic{pic_id}.png"
+                                    source_size = save_prescaled_image(
+                                        z, image_target, os.path.join(temp_img_dir, scaled_filename),
+                                        display_size(width_px, height_px, dpi)
+                                    )
+                                    prescaled_count += source_size is not None
+                                
+                                if source_size is None or keep_original:
+                                    # 从ZIP包中提取图片
+                                    if source_size is not None:
+                                        Path(temp_img_dir, "original").mkdir(exist_ok=True)
+                                        image_save_path = os.path.join(temp_img_dir, "original", image_filename)
+                                    with z.open(image_target) as img_file:
+                                        with open(image_save_path, 'wb') as out_file:
+                                            shutil.copyfileobj(img_file, out_file)
                                 
                                 # 使用相对路径
-                                image_path = f"temp/img/{image_filename}"
+                                if source_size is not None:
+                                    image_path = f"temp/img/{scaled_filename}"
+                                    if keep_original:
+                                        original_path = f"temp/img/original/{image_filename}"
+                                else:
+                                    image_path = f"temp/img/{image_filename}"
                             except Exception as e:
                                 print(f"❌ 保存图片失败: {e}")
                     
@@ -190,11 +338,23 @@ def extract_only_images(pptx_path, output_json):
                         },
                         "image_path": image_path  # 图片保存的本地路径
                     }
+                    if source_size is not None:
+                        element_info["prescaled_from"] = list(source_size)  # 预缩放前的原图尺寸
+                        if original_path:
+                            element_info["original_path"] = original_path
                     
                     slide_info["animated_elements"].append(element_info)
             
-            if slide_info["animated_elements"]:
-                slides_data.append(slide_info)
+            # 按PPT自身的动画时间轴安排图片入场；没有动画的图片从第一帧起就显示
+            timeline, skipped_shapes = build_slide_timeline(
+                tree, {element["id"] for element in slide_info["animated_elements"]}, ns
+            )
+            if timeline is not None:
+                slide_info["timeline"] = timeline
+                skipped_shape_count += skipped_shapes
+            
+            # 无图片元素的页同样保留，由视频生成的静态快速通道直接编码
+            slides_data.append(slide_info)
 
     # 写入 JSON
     with open(output_json, 'w', encoding='utf-8') as f:
@@ -211,8 +371,12 @@ def extract_only_images(pptx_path, output_json):
     print(f"✅ 提取完成！")
     print(f"   - 生成的 JSON 位于: {output_json}")
     print(f"   - 图片保存到: {temp_img_dir}")
-    print(f"   - 共处理 {len(slides_data)} 张幻灯片")
+    print(f"   - 共处理 {len(slides_data)} 张幻灯片（其中 {sum(1 for slide in slides_data if not slide['animated_elements'])} 张无图片元素）")
     print(f"   - 共提取 {sum(len(slide['animated_elements']) for slide in slides_data)} 张图片")
+    print(f"   - 含动画时间轴 {sum(1 for slide in slides_data if 'timeline' in slide)} 张"
+          f"（{skipped_shape_count} 个非图片动画形状保留在背景图中）")
+    if prescale:
+        print(f"   - 预缩放超大图片 {prescaled_count} 张（输出 {dpi} DPI）")
     return True
 
 if __name__ == "__main__":
@@ -6,24 +6,31 @@
 import sys
 import os
 from ppt_parser import extract_ppt_text,pptx_to_images
-from ai_script_generator import generate_ai_script
-from voice_synthesizer import synthesize_voices
+from ai_script_generator import generate_scripts
+from voice_synthesizer import synthesize_voices, TTSQueueWorker
 from video_generator import generate_all_ppt_videos
 from video_merger import merge_videos
 from gen_json import extract_only_images
 from delete_image import run_deletion_test
 from add_voice import merge_video_audio
+from rendition_ladder import generate_rendition_ladder, ladder_render_dpi
+from ffmpeg_runner import GOVERNOR, encode_report
+from config import RENDITIONS, LLM_STREAM, VIDEO_DIR, PROFILE
+import profiling
 
 def main():
     """主函数"""
     
-    # 检查命令行参数
-    if len(sys.argv) < 2:
-        print("使用方法: python main.py <ppt文件路径>")
+    # 检查命令行参数（--profile 开启按步骤的性能分析）
+    args = [arg for arg in sys.argv[1:] if arg != "--profile"]
+    if not args:
+        print("使用方法: python main.py <ppt文件路径> [--profile]")
         print("示例: python main.py presentation.pptx")
         sys.exit(1)
     
-    ppt_path = sys.argv[1]
+    ppt_path = args[0]
+    if PROFILE or "--profile" in sys.argv[1:]:
+        profiling.enable()
     
     if not os.path.exists(ppt_path):
         print(f"错误：文件不存在 {ppt_path}")
@@ -35,6 +42,7 @@ def main():
     
     # 步骤1: 解析PPT
     print("\n[步骤1] 解析PPT文件中的文字...")
+    profiling.stage("1_parse_text")
     try:
         ppt_text = extract_ppt_text(ppt_path)
         print("ppt_text\n",ppt_text)
@@ -44,47 +52,89 @@ def main():
         print(f"PPT解析失败: {e}")
         sys.exit(1)
     
-    # 步骤2: AI生成讲稿
-    print("\n[步骤2] AI生成讲稿...")
-    if not generate_ai_script(ppt_text):
-        print("AI讲稿生成失败")
-        sys.exit(1)
-    
-    # 步骤3: 语音生成讲稿
-    print("\n[步骤3] 语音生成讲稿...")
-    if not synthesize_voices():
-        print("语音合成失败")
-        sys.exit(1)
+    if LLM_STREAM:
+        # 步骤2+3: 流式生成讲稿，每页讲稿完成后立即送入语音合成队列
+        print("\n[步骤2-3] AI流式生成讲稿并同步合成语音...")
+        profiling.stage("2_scripts_voices")
+        tts_worker = TTSQueueWorker().start()
+        script_ok = generate_scripts(ppt_path, ppt_text, stream=True, on_page_script=tts_worker.submit)
+        voice_ok = tts_worker.finish()
+        if not script_ok:
+            print("AI讲稿生成失败")
+            sys.exit(1)
+        if not voice_ok:
+            print("语音合成失败")
+            sys.exit(1)
+    else:
+        # 步骤2: 生成讲稿（演讲者备注或AI，见 SCRIPT_SOURCE）
+        print("\n[步骤2] 生成讲稿...")
+        profiling.stage("2_scripts")
+        if not generate_scripts(ppt_path, ppt_text):
+            print("AI讲稿生成失败")
+            sys.exit(1)
+        
+        # 步骤3: 语音生成讲稿
+        print("\n[步骤3] 语音生成讲稿...")
+        profiling.stage("3_voices")
+        if not synthesize_voices():
+            print("语音合成失败")
+            sys.exit(1)
     
     # 步骤4: 提取每页ppt的图片元素
     print("\n[步骤4] 提取并保存每页ppt的图片元素...")
-    if not extract_only_images(ppt_path, "extract_pic.json"):
+    profiling.stage("4_extract_images")
+    if not extract_only_images(ppt_path, "extract_pic.json", dpi=ladder_render_dpi(RENDITIONS)):
         print("图片元素提取失败")
         sys.exit(1)
 
     # 步骤5: 将元素删除后的img保存至/img
     print("\n[步骤5] 将元素删除后的img保存至/img...")
-    if not run_deletion_test("extract_pic.json",ppt_path):
+    profiling.stage("5_backgrounds")
+    if not run_deletion_test("extract_pic.json",ppt_path, dpi=ladder_render_dpi(RENDITIONS)):
         print("删除图片失败")
         sys.exit(1)
 
     # 步骤6: 生成单页动画视频
     print("\n[步骤6] 生成单页动画视频...")
-    if not generate_all_ppt_videos():
+    profiling.stage("6_slide_videos")
+    # 多分辨率模式下静态页同样输出到单页动画目录，由档位渲染统一封装音频
+    if not generate_all_ppt_videos(segment_dir=None if RENDITIONS else VIDEO_DIR):
         print("单页动画视频生成失败")
         sys.exit(1)
     
+    # 配置了多分辨率档位时：一次合成，split + scale 同时输出所有档位
+    if RENDITIONS:
+        print("\n[步骤7-8] 生成多分辨率视频...")
+        profiling.stage("7_renditions")
+        success, final_videos = generate_rendition_ladder(RENDITIONS)
+        if success:
+            GOVERNOR.report()
+            encode_report()
+            print("\n" + "=" * 50)
+            print("处理完成！最终视频已保存为:")
+            for name, final_video in final_videos.items():
+                print(f"  {name}: {final_video}")
+            print("=" * 50)
+        else:
+            print("\n多分辨率视频生成失败")
+            sys.exit(1)
+        return
+
     # 步骤7: 生成带音频单页视频
     print("\n[步骤7] 生成带音频单页视频...")
+    profiling.stage("7_mux_audio")
     if not merge_video_audio():
         print("单页带音频视频生成失败")
         sys.exit(1)
 
     # 步骤8: 合并视频
     print("\n[步骤8] 合并视频...")
+    profiling.stage("8_merge")
     success, final_video = merge_videos()
     
     if success:
+        GOVERNOR.report()
+        encode_report()
         print("\n" + "=" * 50)
         print(f"处理完成！最终视频已保存为: {final_video}")
         print("=" * 50)
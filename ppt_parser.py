@@ -5,12 +5,135 @@ PPT解析模块 - 提取PPT文本内容并生成格式化的文本
 """
 
 import os
+import time
+import zipfile
+import posixpath
 from spire.presentation import *
 from spire.presentation.common import *
 import xml.etree.ElementTree as ET
+from lxml import etree
 import win32com.client
 import pythoncom
-from config import IMG_DIR
+from config import IMG_DIR, PPT_TEXT_BACKEND
+
+# ========== lxml文本提取后端 ==========
+# 直接解析幻灯片XML，避免逐个形状/段落跨越.NET互操作边界
+PPT_NS = {
+    'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'mc': 'http://schemas.openxmlformats.org/markup-compatibility/2006',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+NOTES_REL_TYPE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide'
+
+# 预编译XPath
+XPATH_SLIDE_IDS = etree.XPath('/p:presentation/p:sldIdLst/p:sldId/@r:id', namespaces=PPT_NS)
+XPATH_RELATIONSHIPS = etree.XPath('/rel:Relationships/rel:Relationship', namespaces=PPT_NS)
+XPATH_SP_TREE = etree.XPath('/p:sld/p:cSld/p:spTree', namespaces=PPT_NS)
+XPATH_TX_PARAGRAPHS = etree.XPath('p:txBody/a:p', namespaces=PPT_NS)
+XPATH_TABLE_CELL_PARAGRAPHS = etree.XPath('a:graphic/a:graphicData/a:tbl/a:tr/a:tc/a:txBody/a:p', namespaces=PPT_NS)
+XPATH_PARAGRAPH_PARTS = etree.XPath('a:r/a:t | a:fld/a:t | a:br', namespaces=PPT_NS)
+XPATH_ALTERNATE_CHOICE = etree.XPath('mc:Choice[1]/*', namespaces=PPT_NS)
+XPATH_NOTES_BODY = etree.XPath(
+    '/p:notes/p:cSld/p:spTree//p:sp[p:nvSpPr/p:nvPr/p:ph[@type="body"]]', namespaces=PPT_NS
+)
+
+TAG_SP = etree.QName(PPT_NS['p'], 'sp').text
+TAG_GRP_SP = etree.QName(PPT_NS['p'], 'grpSp').text
+TAG_GRAPHIC_FRAME = etree.QName(PPT_NS['p'], 'graphicFrame').text
+TAG_ALTERNATE_CONTENT = etree.QName(PPT_NS['mc'], 'AlternateContent').text
+TAG_BR = etree.QName(PPT_NS['a'], 'br').text
+
+def _read_rels(z, part_name):
+    """读取某个部件的关系文件，返回 {rId: (目标部件完整路径, 关系类型)}"""
+    rels_name = posixpath.join(posixpath.dirname(part_name), '_rels', posixpath.basename(part_name) + '.rels')
+    if rels_name not in z.namelist():
+        return {}
+    rels = {}
+    for rel in XPATH_RELATIONSHIPS(etree.fromstring(z.read(rels_name))):
+        if rel.get('TargetMode') == 'External':
+            continue
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(part_name), rel.get('Target')))
+        rels[rel.get('Id')] = (target, rel.get('Type'))
+    return rels
+
+def get_slide_part_names(z):
+    """按演示文稿中的播放顺序返回幻灯片部件路径（与Spire的Slides顺序一致）"""
+    presentation_rels = _read_rels(z, 'ppt/presentation.xml')
+    presentation = etree.fromstring(z.read('ppt/presentation.xml'))
+    return [presentation_rels[rid][0] for rid in XPATH_SLIDE_IDS(presentation) if rid in presentation_rels]
+
+def _paragraph_text(paragraph):
+    """拼接段落中的文字（软回车与PowerPoint对象模型一致记为\v）"""
+    return "".join('\v' if part.tag == TAG_BR else (part.text or '') for part in XPATH_PARAGRAPH_PARTS(paragraph))
+
+def _extract_text_from_element(element, text_list):
+    """递归提取形状树中的文本（与 extract_text_from_shape 的遍历规则一致）"""
+    for child in element:
+        tag = child.tag
+        if tag == TAG_SP:
+            paragraphs = XPATH_TX_PARAGRAPHS(child)
+        elif tag == TAG_GRP_SP:
+            _extract_text_from_element(child, text_list)
+            continue
+        elif tag == TAG_GRAPHIC_FRAME:
+            paragraphs = XPATH_TABLE_CELL_PARAGRAPHS(child)
+        elif tag == TAG_ALTERNATE_CONTENT:
+            _extract_text_from_element(XPATH_ALTERNATE_CHOICE(child), text_list)
+            continue
+        else:
+            continue
+        for paragraph in paragraphs:
+            text = _paragraph_text(paragraph)
+            if text and text.strip():
+                text_list.append(text)
+
+def extract_slide_text_lxml(slide_xml):
+    """提取单张幻灯片XML中的所有文本"""
+    slide_text = []
+    for sp_tree in XPATH_SP_TREE(etree.fromstring(slide_xml)):
+        _extract_text_from_element(sp_tree, slide_text)
+    return slide_text
+
+def extract_notes_text(ppt_path):
+    """
+    读取每页的演讲者备注
+
+    返回:
+        dict: {页码: 备注文本}，只包含有备注的页
+    """
+    notes = {}
+    with zipfile.ZipFile(ppt_path, 'r') as z:
+        for slide_index, slide_part in enumerate(get_slide_part_names(z)):
+            notes_parts = [target for target, rel_type in _read_rels(z, slide_part).values() if rel_type == NOTES_REL_TYPE]
+            if not notes_parts or notes_parts[0] not in z.namelist():
+                continue
+            notes_xml = etree.fromstring(z.read(notes_parts[0]))
+            lines = []
+            for body in XPATH_NOTES_BODY(notes_xml):
+                for paragraph in XPATH_TX_PARAGRAPHS(body):
+                    text = _paragraph_text(paragraph).replace('\v', '\n')
+                    if text.strip():
+                        lines.append(text.strip())
+            if lines:
+                notes[slide_index + 1] = "\n".join(lines)
+    return notes
+
+def extract_ppt_text_lxml(ppt_path):
+    """
+    lxml后端：直接读取幻灯片XML中的 a:t 文本
+
+    返回:
+        formatted_text: 格式化的文本 "第n页：文字内容"，与Spire后端输出一致
+    """
+    formatted_text_parts = []
+    with zipfile.ZipFile(ppt_path, 'r') as z:
+        for slide_index, slide_part in enumerate(get_slide_part_names(z)):
+            slide_text = " ".join(extract_slide_text_lxml(z.read(slide_part)))
+            if slide_text:
+                formatted_text_parts.append(f"第{slide_index + 1}页：{slide_text}")
+    return "\n".join(formatted_text_parts)
 
 def extract_text_from_shape(shape, text_list):
     """递归提取形状中的文本"""
@@ -45,13 +168,14 @@ def extract_slide_text(slide):
         extract_text_from_shape(shape, slide_text)
     return slide_text
 
-def extract_ppt_text(ppt_path, output_xml_dir="temp"):
+def extract_ppt_text(ppt_path, output_xml_dir="temp", backend=PPT_TEXT_BACKEND):
     """
     从PPT中提取所有文本内容并保存为每页ppt为图片
     
     参数:
         ppt_path: PPT文件路径
         output_xml_dir: 保存XML文件的目录
+        backend: 文本提取后端，spire 或 lxml
     
     返回:
         formatted_text: 格式化的文本 "第n页：文字内容"
@@ -59,6 +183,9 @@ def extract_ppt_text(ppt_path, output_xml_dir="temp"):
     # 创建输出目录
     os.makedirs(output_xml_dir, exist_ok=True)
     
+    if backend == "lxml":
+        return extract_ppt_text_lxml(ppt_path)
+    
     # 加载PPT文件[citation:1]
     presentation = Presentation()
     presentation.LoadFromFile(ppt_path)
@@ -89,10 +216,11 @@ def extract_ppt_text(ppt_path, output_xml_dir="temp"):
     # 返回格式化的文本
     return "\n".join(formatted_text_parts)
 
-def pptx_to_images(pptx_path, dpi=96):
+def pptx_to_images(pptx_path, dpi=96, slide_numbers=None):
     """
     Windows系统下使用PowerPoint原生引擎转换PPTX到图片
     图片自动保存到项目根目录的img文件夹下
+    slide_numbers: 只导出这些页（页码从1开始），None表示全部导出
     """
     # 初始化COM环境
     pythoncom.CoInitialize()
@@ -122,11 +250,15 @@ def pptx_to_images(pptx_path, dpi=96):
         )
         
         slide_count = presentation.Slides.Count
-        print(f"开始转换：共 {slide_count} 页幻灯片")
+        if slide_numbers is None:
+            slide_numbers = range(1, slide_count + 1)
+        else:
+            slide_numbers = [i for i in slide_numbers if 1 <= i <= slide_count]
+        print(f"开始转换：共 {slide_count} 页幻灯片，导出 {len(slide_numbers)} 页")
         print(f"图片将保存到：{output_dir}")
         
         # 逐页导出（使用img文件夹的绝对路径）
-        for i in range(1, slide_count + 1):
+        for i in slide_numbers:
             slide = presentation.Slides(i)
             # 生成img文件夹下的绝对路径（确保反斜杠）
             output_path = os.path.join(output_dir, f"page_{i}.png").replace("/", "\\")
@@ -152,6 +284,26 @@ def pptx_to_images(pptx_path, dpi=96):
             del powerpoint
         pythoncom.CoUninitialize()
 
+def benchmark_text_backends(ppt_path, repeat=3):
+    """
+    对比Spire与lxml两种文本提取后端的耗时，并检查输出是否一致
+
+    返回:
+        dict: {后端: 平均耗时（秒）}
+    """
+    timings = {}
+    outputs = {}
+    for backend in ("spire", "lxml"):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            outputs[backend] = extract_ppt_text(ppt_path, backend=backend)
+        timings[backend] = (time.perf_counter() - started) / repeat
+        print(f"{backend}: 平均 {timings[backend] * 1000:.1f} ms")
+
+    print(f"加速比: {timings['spire'] / timings['lxml']:.1f}x")
+    print("输出一致" if outputs["spire"] == outputs["lxml"] else "⚠️ 输出不一致")
+    return timings
+
 # def save_slide_xml(slide, slide_index, output_dir):
 #     """
 #     保存幻灯片的XML表示（简化版）
@@ -179,4 +331,8 @@ def pptx_to_images(pptx_path, dpi=96):
 #     tree = ET.ElementTree(root)
 #     tree.write(xml_file, encoding="utf-8", xml_declaration=True)
     
-#     return xml_file
\ No newline at end of file
+#     return xml_file
+
+if __name__ == "__main__":
+    import sys
+    benchmark_text_backends(sys.argv[1] if len(sys.argv) > 1 else "test.pptx")
@@ -0,0 +1,165 @@
+# 性能分析模块
+"""
+性能分析模块 - 可选开启（PROFILE=true 或 python main.py <ppt> --profile），
+按流程步骤分段采集：
+    - 确定性分析：主线程的 cProfile，每个步骤保存为 <序号>_<步骤>.prof（可用 pstats / snakeviz 查看）
+    - 采样分析：后台线程定时采样所有线程的调用栈，保存为折叠栈 <序号>_<步骤>.folded
+      （flamegraph.pl / speedscope 可直接生成火焰图），每页渲染任务以任务名作为栈根
+    - FFmpeg子进程：按 ffmpeg_runner 记录的墙钟时间折算为采样数，以 "ffmpeg <输出文件>" 帧
+      并入同一份折叠栈，Python热点与子进程耗时在火焰图中并列显示
+"""
+
+import os
+import sys
+import time
+import atexit
+import cProfile
+import pstats
+import threading
+
+from config import PROFILE_DIR
+from ffmpeg_runner import ENCODE_LOG
+
+# 采样间隔（秒）
+SAMPLE_INTERVAL = 0.005
+
+# 线程阻塞等待FFmpeg子进程时所在的函数：这段时间已按子进程墙钟时间计入 "ffmpeg <输出文件>" 帧，
+# 采样时跳过，避免同一段时间在折叠栈中计两次
+FFMPEG_WAIT_FRAMES = {("ffmpeg_runner.py", "_run_tracked"), ("ffmpeg_runner.py", "wait")}
+# 等待时位于其下的标准库帧（Popen.wait、Thread.join 等）
+STDLIB_WAIT_FILES = {"subprocess.py", "threading.py", "selectors.py"}
+
+def waiting_on_ffmpeg(frame):
+    """采样到的栈（frame 为最内层帧）是否正阻塞在等待FFmpeg子进程上"""
+    while frame is not None and os.path.basename(frame.f_code.co_filename) in STDLIB_WAIT_FILES:
+        frame = frame.f_back
+    return frame is not None and (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in FFMPEG_WAIT_FRAMES
+
+class StackSampler:
+    """定时采样所有线程的调用栈，累计为折叠栈计数"""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident or waiting_on_ffmpeg(frame):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+class StageProfile:
+    """一个流程步骤的分析：主线程 cProfile + 全线程采样 + 期间的FFmpeg调用"""
+
+    def __init__(self, name, index, output_dir):
+        self.name = name
+        self.path_prefix = os.path.join(output_dir, f"{index:02d}_{name}")
+        self.task_seconds = {}
+        self._task_lock = threading.Lock()
+
+    def start(self):
+        self.encode_start = len(ENCODE_LOG)
+        self.started = time.perf_counter()
+        self.sampler = StackSampler().start()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def add_task(self, name, seconds):
+        with self._task_lock:
+            self.task_seconds[name] = self.task_seconds.get(name, 0.0) + seconds
+
+    def stop(self):
+        self.profile.disable()
+        self.sampler.stop()
+        elapsed = time.perf_counter() - self.started
+        encodes = ENCODE_LOG[self.encode_start:]
+
+        self.profile.dump_stats(f"{self.path_prefix}.prof")
+
+        # 子进程墙钟时间折算为采样数，挂在发起调用的线程（任务）下面（等待期间的采样已跳过）
+        counts = dict(self.sampler.counts)
+        for record in encodes:
+            key = f"{record.get('thread', 'MainThread')};ffmpeg {record['label']}"
+            counts[key] = counts.get(key, 0) + max(1, int(round(record["wall_seconds"] / self.sampler.interval)))
+        with open(f"{self.path_prefix}.folded", 'w', encoding='utf-8') as f:
+            for key, count in sorted(counts.items()):
+                f.write(f"{key} {count}\n")
+
+        ffmpeg_seconds = sum(record["wall_seconds"] for record in encodes)
+        print(f"\n🔬 性能分析 [{self.name}]: 耗时 {elapsed:.2f} 秒，采样 {self.sampler.samples} 次，"
+              f"FFmpeg {len(encodes)} 次共 {ffmpeg_seconds:.2f} 秒")
+        stats = pstats.Stats(self.profile)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        for (filename, line, function), (_, _, total_time, cumulative, _) in top[:5]:
+            print(f"   {cumulative:8.3f}s 累计  {total_time:8.3f}s 自身  {function} ({os.path.basename(filename)}:{line})")
+        if self.task_seconds:
+            slowest = sorted(self.task_seconds.items(), key=lambda item: item[1], reverse=True)[:3]
+            print("   最慢的任务: " + "，".join(f"{name} {seconds:.2f} 秒" for name, seconds in slowest))
+        print(f"   已保存: {self.path_prefix}.prof / .folded")
+
+# 当前状态：是否开启、输出目录、正在分析的步骤
+_state = {"enabled": False, "output_dir": PROFILE_DIR, "stage": None, "count": 0}
+
+def enable(output_dir=PROFILE_DIR):
+    """开启性能分析，进程退出时自动结束最后一个步骤"""
+    if _state["enabled"]:
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    _state.update(enabled=True, output_dir=output_dir)
+    atexit.register(finish)
+    print(f"🔬 性能分析已开启，结果保存在: {os.path.abspath(output_dir)}")
+
+def stage(name):
+    """结束上一个步骤的分析并开始新的步骤（未开启时不做任何事）"""
+    if not _state["enabled"]:
+        return
+    finish()
+    _state["count"] += 1
+    _state["stage"] = StageProfile(name, _state["count"], _state["output_dir"]).start()
+
+def finish():
+    """结束当前步骤的分析并写出结果"""
+    current, _state["stage"] = _state["stage"], None
+    if current is not None:
+        current.stop()
+
+def run_task(name, func, *args, **kwargs):
+    """
+    以任务名运行一个单页任务：开启分析时线程临时改名为任务名（采样栈根与FFmpeg记录都以此归属），
+    并统计任务耗时
+    """
+    if not _state["enabled"]:
+        return func(*args, **kwargs)
+    thread = threading.current_thread()
+    original_name, thread.name = thread.name, name
+    started = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        thread.name = original_name
+        current = _state["stage"]
+        if current is not None:
+            current.add_task(name, time.perf_counter() - started)
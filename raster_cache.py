@@ -0,0 +1,225 @@
+# 幻灯片栅格缓存模块
+"""
+幻灯片栅格缓存模块 - 按内容寻址持久缓存背景图，
+内容未变化的页直接复用已有的栅格结果，只对变化的页调用PowerPoint导出。
+缓存目录可被同一台机器上的多个任务同时使用：写入先写临时文件再原子替换，
+淘汰由锁文件串行化
+"""
+
+import os
+import time
+import uuid
+import shutil
+import hashlib
+
+from config import RASTER_CACHE_DIR, RASTER_CACHE_MB
+
+REL_TYPE_PREFIX = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/"
+# 备注页不参与渲染，修改备注不应使栅格结果失效
+NOTES_REL_TYPE = REL_TYPE_PREFIX + "notesSlide"
+# 指向其他幻灯片的超链接只记录目标名称，不展开其内容
+SLIDE_REL_TYPE = REL_TYPE_PREFIX + "slide"
+SLIDE_LAYOUT_REL_TYPE = REL_TYPE_PREFIX + "slideLayout"
+SLIDE_MASTER_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.slideMaster+xml"
+
+LOCK_FILE_NAME = ".lock"
+# 锁文件超过该时长视为持有者已异常退出
+LOCK_STALE_SECONDS = 60
+
+def _hash_part(part, digest, visited):
+    """递归摘要部件内容及其引用的版式、母版、主题和媒体"""
+    if part.partname in visited:
+        return
+    visited.add(part.partname)
+    digest.update(f"\n[{part.partname}]\n".encode())
+    digest.update(hashlib.sha256(part.blob).digest())
+
+    is_master = part.content_type == SLIDE_MASTER_CONTENT_TYPE
+    for rel in sorted(part.rels.values(), key=lambda r: r.rId):
+        if rel.reltype == NOTES_REL_TYPE:
+            continue
+        digest.update(f"{rel.rId} {rel.reltype} {rel.target_ref}\n".encode())
+        if rel.is_external or rel.reltype == SLIDE_REL_TYPE:
+            continue
+        # 母版引用其下所有版式，只跟随幻灯片实际使用的那一个
+        if is_master and rel.reltype == SLIDE_LAYOUT_REL_TYPE:
+            continue
+        _hash_part(rel.target_part, digest, visited)
+
+def slide_raster_key(slide, dpi):
+    """
+    计算幻灯片的栅格缓存键：幻灯片XML + 关系 + 版式/母版/主题 + 引用的媒体内容 + 渲染DPI
+
+    参数:
+        slide: python-pptx 的 Slide 对象（删除元素之后的状态）
+        dpi: 栅格化DPI
+
+    返回:
+        str: sha256十六进制摘要
+    """
+    digest = hashlib.sha256()
+    digest.update(f"dpi={dpi}\n".encode())
+    _hash_part(slide.part, digest, set())
+    return digest.hexdigest()
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}.png")
+
+def fetch(key, output_path, cache_dir=RASTER_CACHE_DIR):
+    """
+    命中时把缓存的背景图复制到 output_path，并刷新其最近使用时间
+
+    返回:
+        bool: 是否命中
+    """
+    cached_path = _cache_path(key, cache_dir)
+    try:
+        shutil.copyfile(cached_path, output_path)
+    except OSError:
+        # 未缓存、恰好被其他任务淘汰，或（Windows）正被其他任务替换
+        return False
+    try:
+        os.utime(cached_path)
+    except OSError:
+        pass
+    return True
+
+def store(key, image_path, cache_dir=RASTER_CACHE_DIR):
+    """
+    把新渲染的背景图写入缓存（先写临时文件再原子替换）；写入一批后应调用 evict 控制容量。
+    缓存只是加速，写入失败时跳过该条目
+
+    返回:
+        bool: 是否写入
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    cached_path = _cache_path(key, cache_dir)
+    temp_path = f"{cached_path}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(image_path, temp_path)
+        # Windows 上目标正被其他任务读取时替换会抛出 PermissionError
+        os.replace(temp_path, cached_path)
+    except OSError as e:
+        print(f"⚠️  背景图未写入栅格缓存: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+    return True
+
+class CacheLock:
+    """基于 O_EXCL 锁文件的跨进程互斥锁（Windows 与 Linux 通用）"""
+
+    def __init__(self, cache_dir, timeout=LOCK_STALE_SECONDS * 2):
+        # 等待时长需大于失效判定时长，持有者异常退出留下的锁文件才能在超时前被清理
+        self.lock_path = os.path.join(cache_dir, LOCK_FILE_NAME)
+        self.timeout = timeout
+        # 写入锁文件的持有者标识，释放时只删除自己的锁
+        self.token = f"{os.getpid()}-{uuid.uuid4().hex}"
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, self.token.encode())
+                os.close(fd)
+                return self
+            except (FileExistsError, PermissionError):
+                # Windows 上锁文件正在被删除时 O_EXCL 创建会抛出 PermissionError，同样稍后重试
+                pass
+            if self._break_stale():
+                continue
+            if time.time() > deadline:
+                raise TimeoutError(f"等待栅格缓存锁超时: {self.lock_path}")
+            time.sleep(0.05)
+
+    def _read_lock(self, path):
+        """返回 (修改时间, 持有者标识)；文件不存在或无法读取时返回 None"""
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, 'rb') as f:
+                return mtime, f.read()
+        except OSError:
+            return None
+
+    def _break_stale(self):
+        """
+        清理持有者已异常退出的锁：先把锁文件改名为唯一名称再核对，
+        避免删掉其他等待者刚清理后重新创建的锁
+
+        返回:
+            bool: 锁已不存在或已被清理，应立即重试获取
+        """
+        observed = self._read_lock(self.lock_path)
+        if observed is None:
+            return True
+        if time.time() - observed[0] <= LOCK_STALE_SECONDS:
+            return False
+        claimed_path = f"{self.lock_path}.{self.token}.stale"
+        try:
+            os.rename(self.lock_path, claimed_path)
+        except OSError:
+            # 已被其他等待者清理或改名
+            return True
+        if self._read_lock(claimed_path) != observed:
+            # 改名前锁已被换成新的持有者：放回原处（已有新锁时不覆盖）
+            try:
+                os.link(claimed_path, self.lock_path)
+            except OSError:
+                pass
+        try:
+            os.remove(claimed_path)
+        except OSError:
+            pass
+        return True
+
+    def __exit__(self, exc_type, exc, tb):
+        observed = self._read_lock(self.lock_path)
+        if observed is None or observed[1] != self.token.encode():
+            # 持有过久已被其他任务当作失效锁清理
+            return
+        try:
+            os.remove(self.lock_path)
+        except OSError:
+            pass
+
+def evict(cache_dir=RASTER_CACHE_DIR, max_bytes=RASTER_CACHE_MB * 1024 * 1024):
+    """
+    缓存超出容量时按最近使用时间（mtime）从旧到新删除；正被其他任务读取而无法删除的条目跳过
+
+    返回:
+        int: 删除的条目数
+    """
+    with CacheLock(cache_dir):
+        entries = []
+        total_bytes = 0
+        for entry in os.scandir(cache_dir):
+            if not entry.name.endswith(".png"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_bytes += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Windows 上正被复制的文件无法删除，保留到下次淘汰
+                continue
+            else:
+                removed += 1
+            total_bytes -= size
+
+    if removed:
+        print(f"🗂️  栅格缓存超出 {max_bytes / (1024*1024):.0f} MB，已淘汰 {removed} 项")
+    return removed
@@ -0,0 +1,178 @@
+# 渲染内存预算模块
+"""
+渲染内存预算模块 - 按清单估算每页渲染的内存峰值，限制同时渲染的页数，
+使所有在渲染的页的估算内存之和不超过预算（单页超出预算时独占运行）
+
+用法:
+    python render_budget.py                   # 合成大体量测试文稿，检查峰值RSS是否在预算内
+    python render_budget.py --budget-mb 300 --workers 4 --slides 6
+"""
+
+import threading
+from collections import deque
+
+from config import RENDER_MEMORY_MB, IMAGE_CACHE_MB
+
+MB = 1024 * 1024
+
+def render_budget_bytes(memory_mb=RENDER_MEMORY_MB, image_cache_mb=IMAGE_CACHE_MB):
+    """
+    渲染阶段可分给各页的字节数：总预算减去元素图片解码缓存的上限
+
+    返回:
+        int: 字节数，0 表示不限制
+    """
+    if not memory_mb:
+        return 0
+    available = (memory_mb - image_cache_mb) * MB
+    if available <= 0:
+        print(f"⚠️  渲染内存预算 {memory_mb} MB 不大于图片缓存上限 {image_cache_mb} MB，将逐页渲染")
+        return 1
+    return available
+
+class RenderBudget:
+    """
+    内存预算：各页先登记估算内存再开始渲染，超出预算时按提交顺序排队等待
+    """
+
+    def __init__(self, max_bytes=0):
+        """
+        参数:
+            max_bytes: 预算字节数，0 表示不限制
+        """
+        self.max_bytes = max_bytes
+        self.reserved = 0
+        self.running = 0
+        self.peak_reserved = 0
+        self.peak_running = 0
+        self.waits = 0
+        self.oversized = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+
+    def _fits(self, nbytes):
+        # 没有其他页在渲染时总是放行，否则超出预算的单页永远无法开始
+        return not self.max_bytes or self.running == 0 or self.reserved + nbytes <= self.max_bytes
+
+    def acquire(self, nbytes):
+        """登记一页的估算内存，预算不足时阻塞；按调用顺序放行，大页不会被小页饿死"""
+        with self._cond:
+            ticket = object()
+            self._queue.append(ticket)
+            waited = False
+            while self._queue[0] is not ticket or not self._fits(nbytes):
+                waited = True
+                self._cond.wait()
+            self._queue.popleft()
+            if waited:
+                self.waits += 1
+            if self.max_bytes and nbytes > self.max_bytes:
+                self.oversized += 1
+            self.reserved += nbytes
+            self.running += 1
+            self.peak_reserved = max(self.peak_reserved, self.reserved)
+            self.peak_running = max(self.peak_running, self.running)
+            self._cond.notify_all()
+
+    def release(self, nbytes):
+        with self._cond:
+            self.reserved -= nbytes
+            self.running -= 1
+            self._cond.notify_all()
+
+    def report(self):
+        limit = f"{self.max_bytes / MB:.0f} MB" if self.max_bytes else "不限"
+        print(f"🧮 渲染内存预算: {limit}，估算峰值 {self.peak_reserved / MB:.0f} MB，"
+              f"最多同时渲染 {self.peak_running} 页，排队 {self.waits} 次"
+              + (f"，{self.oversized} 页超出预算独占运行" if self.oversized else ""))
+
+def peak_rss_bytes():
+    """本进程的峰值常驻内存（字节）；不支持的平台返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    import sys
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 以字节为单位，Linux 以KB为单位
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def check_heavy_deck(budget_mb=400, workers=4, slides=6, elements=8, element_size=(1200, 900), fps=30):
+    """
+    合成一份大体量测试文稿（1080p背景、每页多张大图），按预算渲染，
+    检查每页视频都已生成，且渲染期间本进程峰值RSS的增量在预算内
+
+    返回:
+        bool: 是否全部生成且在预算内
+    """
+    import os
+    import json
+    import tempfile
+    import numpy as np
+    from PIL import Image
+    import video_generator
+
+    work_dir = tempfile.mkdtemp(prefix="render_budget_")
+    rng = np.random.default_rng(0)
+    manifest = {"slides": []}
+    for slide_num in range(1, slides + 1):
+        background = rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+        Image.fromarray(background).save(os.path.join(work_dir, f"page_{slide_num}.png"))
+        slide = {"slide_number": str(slide_num), "animated_elements": []}
+        for index in range(elements):
+            path = os.path.join(work_dir, f"slide{slide_num}_pic{index}.png")
+            rgba = rng.integers(0, 256, (element_size[1], element_size[0], 4), dtype=np.uint8)
+            Image.fromarray(rgba, "RGBA").save(path, compress_level=0)
+            slide["animated_elements"].append({
+                "id": str(index),
+                "image_path": path,
+                # 清单坐标以 1280x720 为基准，1080p背景下放大1.5倍
+                "position": {"x_px": (index * 37) % 400, "y_px": (index * 23) % 200,
+                             "width_px": element_size[0] * 2 // 3, "height_px": element_size[1] * 2 // 3}
+            })
+        manifest["slides"].append(slide)
+    manifest_path = os.path.join(work_dir, "extract_pic.json")
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+
+    # 测试素材互不相同，解码缓存只会增加内存占用，这里不启用
+    video_generator.IMAGE_CACHE.max_bytes = 0
+    budget_bytes = budget_mb * MB
+    video_dir = os.path.join(work_dir, "video")
+    baseline = peak_rss_bytes()
+    video_generator.generate_all_ppt_videos(
+        manifest_path, bg_img_dir=work_dir, output_video_dir=video_dir, fps=fps,
+        segment_dir=None, workers=workers, budget=RenderBudget(budget_bytes)
+    )
+    peak = peak_rss_bytes()
+
+    # 渲染失败（如找不到FFmpeg）时内存自然不会增长，必须先确认每页都有输出
+    missing = []
+    for slide_num in range(1, slides + 1):
+        video_path = os.path.join(video_dir, f"page_{slide_num}.mp4")
+        if not os.path.exists(video_path) or os.path.getsize(video_path) == 0:
+            missing.append(f"page_{slide_num}.mp4")
+    if missing:
+        print(f"❌ {len(missing)}/{slides} 页视频未生成或为空: {', '.join(missing)}")
+        return False
+
+    if baseline is None:
+        print("⚠️  当前平台无法读取峰值RSS，仅确认视频已全部生成")
+        return True
+    growth = peak - baseline
+    within = growth <= budget_bytes
+    print(f"{'✅' if within else '❌'} 峰值RSS增量 {growth / MB:.0f} MB / 预算 {budget_mb} MB"
+          f"（进程峰值 {peak / MB:.0f} MB）")
+    return within
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="渲染内存预算检查")
+    parser.add_argument("--budget-mb", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--slides", type=int, default=6)
+    parser.add_argument("--elements", type=int, default=8)
+    args = parser.parse_args()
+    sys.exit(0 if check_heavy_deck(args.budget_mb, args.workers, args.slides, args.elements) else 1)
@@ -0,0 +1,226 @@
+# 多分辨率输出模块
+"""
+多分辨率输出模块 - 每页只合成一次（最高分辨率），
+再用一次FFmpeg调用的 split + scale 同时产出所有档位，
+最后一次FFmpeg调用拼接出所有档位的最终视频
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+from config import TEMP_VIDEO, VOICE_DIR, VIDEO_DIR
+from add_voice import get_duration, find_voice_file
+from video_merger import extract_page_number, create_job_temp_dir, build_concat_list
+from ffmpeg_runner import run_ffmpeg, encode_threads
+
+# 档位名称 -> 输出高度（宽度按比例缩放并保持偶数）
+RENDITION_PRESETS = {
+    "1080p": 1080,
+    "720p": 720,
+    "480p": 480,
+    "360p": 360,
+}
+
+def parse_renditions(spec):
+    """
+    解析档位配置
+
+    参数:
+        spec: 逗号分隔的档位字符串（如 "1080p,720p,480p"）或档位列表
+
+    返回:
+        list: 去重后按分辨率从高到低排列的档位名称
+    """
+    if not spec:
+        return []
+    if isinstance(spec, str):
+        spec = spec.split(',')
+
+    names = []
+    for name in spec:
+        name = name.strip()
+        if not name or name in names:
+            continue
+        if name not in RENDITION_PRESETS:
+            raise ValueError(f"未知的输出档位: {name}（可选: {', '.join(RENDITION_PRESETS)}）")
+        names.append(name)
+
+    return sorted(names, key=lambda n: RENDITION_PRESETS[n], reverse=True)
+
+def ladder_render_dpi(renditions, base_dpi=96, base_height=720):
+    """
+    计算背景图栅格化所需的DPI，使合成分辨率等于最高档位
+
+    默认96DPI下16:9幻灯片为720像素高，按最高档位等比放大
+    """
+    names = parse_renditions(renditions)
+    if not names:
+        return base_dpi
+    return max(base_dpi, int(round(base_dpi * RENDITION_PRESETS[names[0]] / base_height)))
+
+def render_slide_ladder(video_path, audio_path, output_paths, fade_duration=1.0):
+    """
+    单页一次性输出所有档位：延长末帧 + 渐入渐出只做一次，split 后分别缩放，
+    每个档位各自封装一次音频
+
+    参数:
+        video_path: 已合成的单页动画视频（最高分辨率）
+        audio_path: 对应的讲稿音频
+        output_paths: {档位名称: 输出路径}
+        fade_duration: 渐入渐出时长（秒）
+
+    返回:
+        bool: 是否成功
+    """
+    video_duration = get_duration(video_path)
+    audio_duration = get_duration(audio_path)
+    if not video_duration or not audio_duration:
+        print("  无法获取时长，跳过")
+        return False
+
+    # 与 add_voice 保持一致：最终时长以音频为准，音频更长时定格最后一帧
+    total_duration = audio_duration
+    if total_duration < fade_duration * 2:
+        fade_duration = total_duration / 3
+
+    video_chain = []
+    if audio_duration > video_duration:
+        video_chain.append(f"tpad=stop_mode=clone:stop_duration={audio_duration - video_duration}")
+    video_chain.append(f"fade=t=in:st=0:d={fade_duration}")
+    video_chain.append(f"fade=t=out:st={total_duration - fade_duration}:d={fade_duration}")
+    video_chain.append(f"split={len(output_paths)}" + "".join(f"[s{i}]" for i in range(len(output_paths))))
+
+    filter_parts = ["[0:v]" + ",".join(video_chain)]
+    for i, name in enumerate(output_paths):
+        height = RENDITION_PRESETS[name]
+        filter_parts.append(f"[s{i}]scale=-2:{height}:flags=lanczos,setsar=1,format=yuv420p[v{i}]")
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-i", str(video_path),
+        "-i", str(audio_path),
+        "-filter_complex", ";".join(filter_parts),
+    ]
+    for i, (name, output_path) in enumerate(output_paths.items()):
+        cmd += [
+            "-map", f"[v{i}]",
+            "-map", "1:a",
+            "-c:v", "libx264",
+            "-preset", "medium",
+            "-crf", "23",
+            "-c:a", "aac",
+            "-b:a", "128k",
+            "-t", str(total_duration),
+            str(output_path)
+        ]
+
+    result = run_ffmpeg(cmd, threads=encode_threads(), outputs=list(output_paths.values()),
+                        capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    if result.returncode != 0:
+        print(f"  错误: {result.stderr[-300:]}")
+        return False
+    return True
+
+def concatenate_renditions(segments, output_files):
+    """
+    一次FFmpeg调用拼接所有档位
+
+    参数:
+        segments: {档位名称: [按页码排序的片段路径]}
+        output_files: {档位名称: 最终输出路径}
+
+    返回:
+        bool: 是否成功
+    """
+    # 多个concat输入无法共用stdin，列表文件写在本次任务独立的临时目录中
+    list_dir = create_job_temp_dir("ladder_")
+
+    cmd = ["ffmpeg", "-y"]
+    for name in output_files:
+        list_file = os.path.join(list_dir, f"concat_list_{name}.txt")
+        with open(list_file, 'w', encoding='utf-8') as f:
+            f.write(build_concat_list(segments[name]))
+        cmd += ["-f", "concat", "-safe", "0", "-i", list_file]
+
+    for i, output_file in enumerate(output_files.values()):
+        cmd += ["-map", str(i), "-c", "copy", "-movflags", "+faststart", output_file]
+
+    print(f"正在拼接 {len(output_files)} 个档位...")
+    result = run_ffmpeg(cmd, outputs=list(output_files.values()),
+                        capture_output=True, text=True, encoding='utf-8', errors='ignore')
+
+    shutil.rmtree(list_dir, ignore_errors=True)
+
+    if result.returncode != 0:
+        print("拼接失败")
+        print(f"错误信息: {result.stderr}")
+        return False
+    return True
+
+def generate_rendition_ladder(renditions, video_dir=TEMP_VIDEO, audio_dir=VOICE_DIR, output_dir=VIDEO_DIR, output_prefix="./final_video"):
+    """
+    主函数：替代 merge_video_audio + merge_videos，产出多分辨率的最终视频
+
+    参数:
+        renditions: 档位配置（见 parse_renditions）
+        video_dir: 单页动画视频目录（最高分辨率合成结果）
+        audio_dir: 讲稿音频目录
+        output_dir: 各档位单页片段的根目录（每个档位一个子目录）
+        output_prefix: 最终视频路径前缀，实际文件名为 "<前缀>_<档位>.mp4"
+
+    返回:
+        (bool, dict): 是否成功, {档位名称: 最终视频绝对路径}
+    """
+    names = parse_renditions(renditions)
+    if not names:
+        print("未配置输出档位")
+        return False, None
+
+    video_files = sorted(
+        (f for f in Path(video_dir).glob("page_*.mp4") if extract_page_number(f.name) is not None),
+        key=lambda f: extract_page_number(f.name)
+    )
+    if not video_files:
+        print(f"在 {video_dir} 目录中未找到 page_*.mp4 文件")
+        return False, None
+
+    print(f"输出档位: {', '.join(names)}，共 {len(video_files)} 页")
+    for name in names:
+        Path(output_dir, name).mkdir(parents=True, exist_ok=True)
+
+    segments = {name: [] for name in names}
+    for video_path in video_files:
+        audio_path = find_voice_file(audio_dir, video_path.stem)
+        if audio_path is None:
+            print(f"跳过 {video_path.name}：未找到对应音频")
+            continue
+
+        print(f"\n处理: {video_path.name} + {audio_path.name}")
+        output_paths = {name: Path(output_dir, name, video_path.name) for name in names}
+        if render_slide_ladder(video_path, audio_path, output_paths):
+            print(f"  ✅ 完成: {', '.join(names)}")
+            for name, path in output_paths.items():
+                segments[name].append(str(path))
+        else:
+            print(f"  ❌ 失败")
+
+    if not segments[names[0]]:
+        print("没有成功处理的视频")
+        return False, None
+
+    output_files = {name: f"{output_prefix}_{name}.mp4" for name in names}
+    if not concatenate_renditions(segments, output_files):
+        print("\n❌ 视频处理失败")
+        return False, None
+
+    final_videos = {}
+    for name, output_file in output_files.items():
+        final_videos[name] = os.path.abspath(output_file)
+        file_size = os.path.getsize(output_file) / (1024*1024)
+        print(f"✅ {name}: {final_videos[name]} ({file_size:.2f} MB)")
+    return True, final_videos
+
+if __name__ == "__main__":
+    from config import RENDITIONS
+    generate_rendition_ladder(RENDITIONS or "1080p,720p,480p")
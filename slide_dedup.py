@@ -0,0 +1,108 @@
+# 重复页去重模块
+"""
+重复页去重模块 - 标题页、章节分隔页、“提问环节”页等常在同一份PPT中原样出现多次。
+按讲稿文本对语音去重、按画面指纹对动画视频去重、按“画面+音频”内容对单页片段去重：
+每个唯一的片段只合成、编码一次，重复页直接复制结果，最终拼接时重复引用同一个渐入渐出片段
+"""
+
+import os
+import json
+import shutil
+import hashlib
+
+def file_digest(path):
+    """文件内容的sha256摘要"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+def element_schedules(slide_data):
+    """
+    每个动画元素实际使用的入场安排（与 video_generator.create_video_for_slide 的取值一致）
+
+    返回:
+        list: 与 animated_elements 一一对应；有动画时间轴时为 [效果, 开始毫秒, 时长毫秒]，
+              不在时间轴中的元素为 "appear"；没有时间轴时为 None（按元素顺序依次入场）
+    """
+    timeline = slide_data.get("timeline")
+    elements = slide_data.get("animated_elements", [])
+    if timeline is None:
+        return [None] * len(elements)
+    events = {str(event["id"]): event for event in timeline}
+    schedules = []
+    for elem in elements:
+        event = events.get(str(elem.get("id")))
+        if event is None:
+            schedules.append("appear")
+        else:
+            schedules.append([event["effect"], event["start_ms"], event["duration_ms"]])
+    return schedules
+
+def visual_fingerprint(slide_data, bg_image_path):
+    """
+    幻灯片的画面指纹：背景图内容 + 每个动画元素的图片内容、位置和入场安排（按出现顺序）。
+    入场安排取自PPT动画时间轴，图片相同但动画顺序或时长不同的页不会被当作重复页
+
+    参数:
+        slide_data: extract_pic.json 中的单页数据
+        bg_image_path: 删除元素后的背景图
+
+    返回:
+        str: sha256十六进制摘要
+    """
+    sha = hashlib.sha256()
+    sha.update(file_digest(bg_image_path).encode())
+    sha.update(b"timeline" if slide_data.get("timeline") is not None else b"sequence")
+    for elem, schedule in zip(slide_data.get("animated_elements", []), element_schedules(slide_data)):
+        img_path = elem.get("image_path")
+        image_digest = file_digest(img_path) if img_path and os.path.exists(img_path) else None
+        sha.update(json.dumps([image_digest, elem.get("position", {}), schedule], sort_keys=True).encode())
+    return sha.hexdigest()
+
+def copy_page_output(source_path, output_dir, stem):
+    """
+    把代表页的输出复制为重复页的输出（扩展名与代表页一致，先写临时文件再替换）
+
+    返回:
+        str: 重复页输出路径
+    """
+    extension = os.path.splitext(source_path)[1]
+    output_path = os.path.join(output_dir, f"{stem}{extension}")
+    if os.path.abspath(source_path) != os.path.abspath(output_path):
+        temp_path = f"{output_path}.{os.getpid()}.tmp"
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, output_path)
+    return output_path
+
+class DedupIndex:
+    """
+    单个处理阶段内的去重索引：内容键 -> 第一次生成的输出文件
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.entries = {}
+        self.reused = 0
+
+    def add(self, key, output_path):
+        """登记某个内容键已生成的输出"""
+        self.entries.setdefault(key, str(output_path))
+
+    def reuse(self, key, output_dir, stem):
+        """
+        内容键已有输出时复制给当前页
+
+        返回:
+            str: 当前页的输出路径；未命中时返回None（调用方应正常生成并 add）
+        """
+        source_path = self.entries.get(key)
+        if source_path is None or not os.path.exists(source_path):
+            return None
+        self.reused += 1
+        return copy_page_output(source_path, output_dir, stem)
+
+    def report(self):
+        if self.reused:
+            print(f"♻️  {self.name}: {len(self.entries)} 个唯一内容，重复页复用 {self.reused} 次")
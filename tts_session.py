@@ -0,0 +1,219 @@
+# 讯飞TTS会话模块
+"""
+讯飞TTS会话模块 - WebSocket鉴权URL签名、签名URL缓存与跨页复用的长连接会话。
+只依赖标准库和 websocket-client，不读取 config，握手开销对比可在没有任何密钥的环境下
+配合本地桩服务（tts_stub_server.py）运行
+"""
+
+import ssl
+import json
+import time
+import hmac
+import base64
+import hashlib
+from urllib.parse import urlencode
+from wsgiref.handlers import format_date_time
+from datetime import datetime
+from time import mktime
+
+import websocket
+
+class AssembleHeaderException(Exception):
+    def __init__(self, msg):
+        self.message = msg
+
+class Url:
+    def __init__(self, host, path, schema):
+        self.host = host
+        self.path = path
+        self.schema = schema
+
+def parse_url(request_url):
+    stidx = request_url.index("://")
+    host = request_url[stidx + 3:]
+    schema = request_url[:stidx + 3]
+    edidx = host.index("/")
+    if edidx <= 0:
+        raise AssembleHeaderException("invalid request url:" + request_url)
+    path = host[edidx:]
+    host = host[:edidx]
+    return Url(host, path, schema)
+
+def assemble_ws_auth_url(request_url, method="GET", api_key="", api_secret=""):
+    """生成带鉴权的WebSocket URL"""
+    u = parse_url(request_url)
+    host = u.host
+    path = u.path
+    
+    now = datetime.now()
+    date = format_date_time(mktime(now.timetuple()))
+    
+    signature_origin = f"host: {host}\ndate: {date}\n{method} {path} HTTP/1.1"
+    signature_sha = hmac.new(
+        api_secret.encode('utf-8'), 
+        signature_origin.encode('utf-8'),
+        digestmod=hashlib.sha256
+    ).digest()
+    signature_sha = base64.b64encode(signature_sha).decode(encoding='utf-8')
+    
+    authorization_origin = (
+        f'api_key="{api_key}", algorithm="hmac-sha256", '
+        f'headers="host date request-line", signature="{signature_sha}"'
+    )
+    authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode(encoding='utf-8')
+    
+    values = {
+        "host": host,
+        "date": date,
+        "authorization": authorization
+    }
+    
+    return request_url + "?" + urlencode(values)
+
+class SignedUrlCache:
+    """
+    鉴权URL缓存：签名中的date在服务端允许的时间窗口内有效，
+    窗口内复用同一个签名URL，避免每页重新计算HMAC
+    """
+
+    def __init__(self, request_url, api_key, api_secret, max_age=240):
+        self.request_url = request_url
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.max_age = max_age
+        self.signed_url = None
+        self.signed_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if self.signed_url is None or now - self.signed_at > self.max_age:
+            self.signed_url = assemble_ws_auth_url(self.request_url, "GET", self.api_key, self.api_secret)
+            self.signed_at = now
+        return self.signed_url
+
+class _StaleConnection(Exception):
+    """连接在收到任何响应前就已关闭"""
+
+class XunfeiTTSSession:
+    """
+    讯飞TTS会话：在调用线程内同步收发，不再为每次请求启动线程
+
+    服务端在一次合成结束后如果没有关闭连接，下一页直接复用该连接；
+    连接已被关闭时自动重新握手。同时统计握手次数与耗时
+    """
+
+    def __init__(self, url_cache, timeout=30):
+        self.url_cache = url_cache
+        self.timeout = timeout
+        self.ws = None
+        self.handshake_count = 0
+        self.handshake_seconds = 0.0
+        self.reuse_count = 0
+
+    def _connect(self):
+        started = time.perf_counter()
+        self.ws = websocket.create_connection(
+            self.url_cache.get(),
+            timeout=self.timeout,
+            sslopt={"cert_reqs": ssl.CERT_NONE}
+        )
+        self.handshake_seconds += time.perf_counter() - started
+        self.handshake_count += 1
+
+    def close(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+
+    def request(self, request_data, on_message):
+        """
+        发送一次合成请求，逐条把服务端消息交给 on_message 处理
+
+        on_message(message) 返回 True 表示本次合成已结束
+
+        返回:
+            float: 请求发出的时间（perf_counter）
+        """
+        if self.ws is not None:
+            try:
+                sent_at = self._exchange(request_data, on_message)
+                self.reuse_count += 1
+                return sent_at
+            except _StaleConnection:
+                # 复用的连接已被服务端关闭，重新握手后重发
+                self.close()
+
+        self._connect()
+        return self._exchange(request_data, on_message)
+
+    def _exchange(self, request_data, on_message):
+        received = False
+        try:
+            self.ws.send(request_data)
+            sent_at = time.perf_counter()
+            while True:
+                message = self.ws.recv()
+                if not message:
+                    # 服务端关闭了连接
+                    self.close()
+                    if not received:
+                        raise _StaleConnection()
+                    return sent_at
+                received = True
+                if on_message(message):
+                    return sent_at
+        except (websocket.WebSocketException, OSError):
+            self.close()
+            if not received:
+                raise _StaleConnection()
+            raise
+
+    def stats(self):
+        requests = self.handshake_count + self.reuse_count
+        return {
+            "handshakes": self.handshake_count,
+            "reused": self.reuse_count,
+            "handshake_ms_total": self.handshake_seconds * 1000,
+            "handshake_ms_avg": self.handshake_seconds * 1000 / self.handshake_count if self.handshake_count else 0.0,
+            "requests": requests
+        }
+
+def benchmark_handshake(ws_url, rounds=10, text="握手开销测试", app_id="benchmark", api_key="benchmark",
+                        api_secret="benchmark"):
+    """
+    对比握手开销：每页新建连接（旧方式） vs 会话复用连接与签名URL
+
+    ws_url 可指向本地桩服务（见 tts_stub_server.py），避免消耗真实配额；
+    桩服务不校验签名，默认使用占位的应用ID与密钥
+    """
+    request_data = json.dumps({
+        "header": {"app_id": app_id, "status": 2},
+        "payload": {
+            "text": {"encoding": "utf8", "status": 2, "text": base64.b64encode(text.encode('utf-8')).decode()}
+        }
+    })
+
+    def on_message(message):
+        message = json.loads(message)
+        if message["header"]["code"] != 0:
+            return True
+        return message.get("payload", {}).get("audio", {}).get("status") == 2
+
+    results = {}
+    for mode in ("per_request", "session"):
+        session = XunfeiTTSSession(SignedUrlCache(ws_url, api_key, api_secret))
+        started = time.perf_counter()
+        for _ in range(rounds):
+            session.request(request_data, on_message)
+            if mode == "per_request":
+                session.close()
+                session.url_cache.signed_url = None
+        elapsed = time.perf_counter() - started
+        session.close()
+        results[mode] = dict(session.stats(), wall_ms=elapsed * 1000)
+        print(f"{mode}: 总耗时 {elapsed * 1000:.0f} ms，握手 {results[mode]['handshakes']} 次，"
+              f"平均握手 {results[mode]['handshake_ms_avg']:.1f} ms")
+    return results
@@ -0,0 +1,170 @@
+# 讯飞TTS本地桩服务
+"""
+讯飞TTS本地桩服务 - 仅依赖标准库的最小WebSocket服务端，
+按讯飞超拟人TTS的消息格式返回假音频，用于在本地测量握手与连接复用开销
+
+用法:
+    python tts_stub_server.py                 # 启动桩服务
+    python tts_stub_server.py --benchmark     # 启动桩服务并运行握手开销对比
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+def _recv_exact(conn, size):
+    data = b""
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("连接已关闭")
+        data += chunk
+    return data
+
+def _read_frame(conn):
+    """读取一个客户端帧，返回 (opcode, payload)"""
+    first, second = _recv_exact(conn, 2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", _recv_exact(conn, 2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", _recv_exact(conn, 8))[0]
+    mask = _recv_exact(conn, 4) if second & 0x80 else None
+    payload = _recv_exact(conn, length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+def _send_frame(conn, opcode, payload):
+    """发送一个服务端帧（服务端帧不加掩码）"""
+    header = bytes([0x80 | opcode])
+    length = len(payload)
+    if length < 126:
+        header += bytes([length])
+    elif length < 65536:
+        header += bytes([126]) + struct.pack(">H", length)
+    else:
+        header += bytes([127]) + struct.pack(">Q", length)
+    conn.sendall(header + payload)
+
+def _handshake(conn):
+    request = b""
+    while b"\r\n\r\n" not in request:
+        chunk = conn.recv(4096)
+        if not chunk:
+            raise ConnectionError("握手失败")
+        request += chunk
+
+    key = None
+    for line in request.decode("latin-1").split("\r\n"):
+        if line.lower().startswith("sec-websocket-key:"):
+            key = line.split(":", 1)[1].strip()
+    accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+    conn.sendall(
+        "HTTP/1.1 101 Switching Protocols\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+    )
+
+def _handle_client(conn, options):
+    try:
+        _handshake(conn)
+        while True:
+            opcode, payload = _read_frame(conn)
+            if opcode == 0x8:
+                _send_frame(conn, 0x8, payload[:2])
+                break
+            if opcode == 0x9:
+                _send_frame(conn, 0xA, payload)
+                continue
+            if opcode != 0x1:
+                continue
+
+            json.loads(payload)
+            time.sleep(options["latency"])
+            for seq in range(options["chunks"]):
+                status = 2 if seq == options["chunks"] - 1 else 1
+                message = {
+                    "header": {"code": 0, "message": "success", "status": status},
+                    "payload": {
+                        "audio": {
+                            "audio": base64.b64encode(os.urandom(options["chunk_size"])).decode(),
+                            "status": status,
+                            "seq": seq
+                        }
+                    }
+                }
+                _send_frame(conn, 0x1, json.dumps(message).encode())
+
+            # 模拟“一次合成后关闭连接”的服务端行为
+            if options["close_after_response"]:
+                _send_frame(conn, 0x8, struct.pack(">H", 1000))
+                break
+    except (ConnectionError, OSError, ValueError):
+        pass
+    finally:
+        conn.close()
+
+def serve(host="127.0.0.1", port=8765, chunks=5, chunk_size=4096, latency=0.0, close_after_response=False):
+    """
+    在后台线程启动桩服务
+
+    返回:
+        (socket, str): 监听套接字, 可直接用作 XUNFEI_TTS_URL 的地址
+    """
+    options = {
+        "chunks": chunks,
+        "chunk_size": chunk_size,
+        "latency": latency,
+        "close_after_response": close_after_response
+    }
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen()
+
+    def accept_loop():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=_handle_client, args=(conn, options), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    port = server.getsockname()[1]
+    return server, f"ws://{host}:{port}/v1/private/stub"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="讯飞TTS本地桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--close-after-response", action="store_true", help="每次合成后关闭连接")
+    parser.add_argument("--benchmark", action="store_true", help="运行握手开销对比")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    server, url = serve(args.host, args.port, close_after_response=args.close_after_response)
+    print(f"桩服务已启动: {url}")
+
+    if args.benchmark:
+        from tts_session import benchmark_handshake
+        benchmark_handshake(url, rounds=args.rounds)
+    else:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    server.close()
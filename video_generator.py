@@ -1,14 +1,227 @@
 import os
 import json
-import subprocess
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from PIL import Image
+from add_voice import find_voice_file, segment_extension, audio_codec_args, get_duration
+from config import IMAGE_CACHE_MB, DEDUP_SLIDES, ANIMATION_EFFECT, ANIMATION_SECONDS, RENDER_WORKERS
+from animation_engine import Animation, Sprite, render_animation, estimate_render_bytes
+from slide_dedup import DedupIndex, visual_fingerprint, file_digest
+from render_budget import RenderBudget, render_budget_bytes
+from ffmpeg_runner import run_ffmpeg, encode_threads, DeckProgress
+from profiling import run_task
 
-def create_video_for_slide(slide_data, bg_image_path, output_video_path, fps=30):
+class DecodedImageCache:
+    """
+    进程级的元素图片缓存：按 (素材内容哈希, 目标尺寸) 缓存解码后的RGBA位图，
+    超过内存上限时按LRU淘汰。返回的图片在多处共享，调用方只能读取不能修改
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 路径 -> ((修改时间, 文件大小), 内容哈希)，避免每次都重新读取文件计算哈希
+        self._digests = {}
+        # (内容哈希, 尺寸) -> 正在解码该图片的线程完成后触发的事件
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _digest(self, path):
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            self._digests[path] = (stamp, digest)
+        return digest
+
+    def get(self, path, size=None):
+        """
+        获取解码（并缩放到 size）后的RGBA图片；哈希、解码与缩放都在锁外进行，
+        同一图片正在被其他线程解码时等待其结果，不重复解码
+
+        参数:
+            path: 素材文件路径
+            size: 目标尺寸 (宽, 高)，None表示原始尺寸
+
+        返回:
+            PIL.Image: RGBA图片
+        """
+        key = (self._digest(str(path)), size)
+        while True:
+            with self._lock:
+                image = self.entries.get(key)
+                if image is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return image
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # 等待后重新查找；图片超出缓存上限未被缓存时由本线程自行解码
+            pending.wait()
+
+        try:
+            if size is None:
+                image = Image.open(path).convert("RGBA")
+            else:
+                image = self.get(path).resize(size, Image.Resampling.LANCZOS)
+            with self._lock:
+                self._store(key, image)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+        return image
+
+    def _store(self, key, image):
+        nbytes = image.width * image.height * 4
+        if nbytes > self.max_bytes:
+            return
+        while self.entries and self.current_bytes + nbytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= evicted.width * evicted.height * 4
+            self.evictions += 1
+        self.entries[key] = image
+        self.current_bytes += nbytes
+
+    def stats(self):
+        """返回命中率与内存占用统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.current_bytes
+            }
+
+    def report(self):
+        stats = self.stats()
+        print(f"🖼️  图片缓存: 命中 {stats['hits']} / 未命中 {stats['misses']}"
+              f"（命中率 {stats['hit_rate']:.1%}），淘汰 {stats['evictions']} 次，"
+              f"占用 {stats['bytes'] / (1024*1024):.1f} MB / {self.max_bytes / (1024*1024):.0f} MB")
+
+# 所有幻灯片共享同一个缓存
+IMAGE_CACHE = DecodedImageCache(IMAGE_CACHE_MB * 1024 * 1024)
+
+# 不带音频编码静态页时（多分辨率模式）的默认时长，之后按讲稿时长定格延长
+STATIC_SLIDE_SECONDS = 1
+
+def encode_static_slide(bg_image_path, output_video_path, audio_path=None, fps=30, on_progress=None):
+    """
+    静态快速通道：无图片元素的页不做逐帧合成，直接由背景图 -loop 1 编码
+
+    参数:
+        bg_image_path: 整页背景图
+        output_video_path: 输出路径；传入 audio_path 时应为带音频片段的路径
+        audio_path: 讲稿音频，传入时在同一次调用中封装音频，时长以音频为准
+        on_progress: 编码进度回调（见 ffmpeg_runner.ProgressTracker）
+
+    返回:
+        bool: 是否成功
+    """
+    if audio_path is not None:
+        duration = get_duration(audio_path)
+        if not duration:
+            print(f"  ❌ 无法获取音频时长: {audio_path}")
+            return False
+    else:
+        duration = STATIC_SLIDE_SECONDS
+
+    cmd = [
+        "ffmpeg", "-y",
+        "-loop", "1",
+        "-framerate", str(fps),
+        "-i", str(bg_image_path),
+    ]
+    if audio_path is not None:
+        cmd += ["-i", str(audio_path)]
+    cmd += [
+        "-c:v", "libx264",
+        "-tune", "stillimage",
+        "-pix_fmt", "yuv420p",
+        "-r", str(fps),
+    ]
+    if audio_path is not None:
+        cmd += audio_codec_args(audio_path)
+    cmd += ["-t", str(duration), str(output_video_path)]
+
+    result = run_ffmpeg(cmd, threads=encode_threads(), duration=duration, on_progress=on_progress,
+                        capture_output=True, text=True, encoding='utf-8', errors='ignore')
+    if result.returncode != 0:
+        print(f"  ❌ 静态页编码失败: {result.stderr[-200:]}")
+        return False
+    print(f"  ⚡ 静态页快速编码完成: {output_video_path}（{duration:.1f} 秒）")
+    return True
+
+def create_static_slide_video(slide_num, bg_image_path, output_video_dir, audio_dir, segment_dir, fps=30,
+                              dedup_index=None, fingerprint=None, on_progress=None):
+    """
+    为无图片元素的页生成视频
+
+    有讲稿音频时直接输出带音频的单页片段到 segment_dir（跳过动画合成和音视频合并），
+    否则输出无声视频到 output_video_dir，交由后续步骤处理
+    dedup_index/fingerprint: 画面指纹与音频内容都相同的页直接复制已编码的结果
+    on_progress: 编码进度回调；直接复用时以一个已完成事件通知
+    """
+    stem = f"page_{slide_num}"
+    silent_video = Path(output_video_dir) / f"{stem}.mp4"
+
+    audio_path = find_voice_file(audio_dir, stem) if segment_dir else None
+    if audio_path is None:
+        output_path = silent_video
+    else:
+        # 清理上一次运行留下的动画视频，避免 merge_video_audio 再次覆盖本页片段
+        if silent_video.exists():
+            silent_video.unlink()
+        Path(segment_dir).mkdir(parents=True, exist_ok=True)
+        output_path = Path(segment_dir) / f"{stem}{segment_extension(audio_path)}"
+        for stale_path in Path(segment_dir).glob(f"{stem}.*"):
+            if stale_path != output_path and stale_path.suffix in (".mp4", ".mov"):
+                stale_path.unlink()
+
+    key = None
+    if dedup_index is not None and fingerprint:
+        key = (fingerprint, file_digest(audio_path) if audio_path else None)
+        if dedup_index.reuse(key, str(output_path.parent), stem):
+            print(f"  ♻️  静态页 {slide_num} 与之前的页完全相同，直接复用")
+            if on_progress is not None:
+                on_progress({"label": output_path.name, "percent": 1.0, "finished": True})
+            return True
+
+    success = encode_static_slide(bg_image_path, output_path, audio_path, fps, on_progress)
+    if success and key is not None:
+        dedup_index.add(key, output_path)
+    return success
+
+def ms_to_frames(ms, fps):
+    """毫秒换算为动画时长帧数（至少1帧）"""
+    return max(1, int(round(ms * fps / 1000)))
+
+def create_video_for_slide(slide_data, bg_image_path, output_video_path, fps=30, budget=None, on_progress=None):
     """
     为单张幻灯片生成动画视频。
     新增参数控制：
         element_duration: 每个元素出现后停留的秒数（默认1秒30帧）
+        budget: RenderBudget，渲染前按估算内存登记，预算不足时等待
+        on_progress: 编码进度回调（见 ffmpeg_runner.ProgressTracker）
     """
     slide_num = slide_data.get("slide_number", "1")
     elements = slide_data.get("animated_elements", [])
@@ -28,142 +241,123 @@ def create_video_for_slide(slide_data, bg_image_path, output_video_path, fps=30)
     print(f"  🎬 开始处理幻灯片 {slide_num}...")
     print(f"     背景图：{bg_image_path}")
     print(f"     元素数：{len(elements)} 个")
-    print(f"     元素停留时间：{element_duration} 秒/个")
+    print(f"     元素停留时间：{element_duration} 帧/个")
+    
+    # PPT自身的动画时间轴（gen_json 解析 p:timing 得到），没有时按元素顺序依次入场
+    timeline = slide_data.get("timeline")
+    if timeline is not None:
+        timeline = {str(event["id"]): event for event in timeline}
     
     # 计算总时长
-    # 总时长 = 1秒（初始纯背景） + (元素数量 × 每个元素停留时间)
-    total_seconds = 1 + (len(elements) * element_duration)
-    print(f"     视频总时长：{total_seconds} 秒")
-
-    # 创建临时目录存放每一秒的合成帧
-    temp_frame_dir = Path(f"temp_frames_slide_{slide_num}")
-    temp_frame_dir.mkdir(exist_ok=True)
+    # 总时长 = 1帧（初始纯背景） + (元素数量 × 每个元素停留帧数)
+    total_frames = 1 + (len(elements) * element_duration)
+    print(f"     视频总时长：{total_frames} 帧")
+    # 入场动画时长不超过元素停留时间
+    animation_frames = max(1, min(element_duration, int(round(ANIMATION_SECONDS * fps))))
+    print(f"     入场效果：{ANIMATION_EFFECT}（{animation_frames} 帧）")
 
     try:
-        # 步骤1：打开并准备背景图
+        # 步骤1：读取背景图尺寸（只读文件头，渲染开始前不解码）
         try:
-            bg_img = Image.open(bg_image_path).convert("RGBA")
-            bg_width, bg_height = bg_img.size
+            with Image.open(bg_image_path) as probe:
+                bg_width, bg_height = probe.size
             print(f"     背景图尺寸：{bg_width} x {bg_height}")
         except Exception as e:
             print(f"  ❌ 无法打开背景图片 {bg_image_path}: {e}")
             return
 
-        # 步骤2：预加载所有元素图片
-        element_images = []
-        for elem in elements:
+        # 步骤2：规划所有元素（位图在入场时才解码缩放，烘焙进底图后释放）
+        scale_x = bg_width / 1280.0
+        scale_y = bg_height / 720.0
+        animations = []
+        # 单个素材原图解码的最大临时内存（RGBA，另含一份模式转换）
+        source_bytes = 0
+        for elem_index, elem in enumerate(elements):
             img_path = elem.get("image_path")
             if not img_path or not Path(img_path).exists():
                 print(f"  ⚠️  元素图片不存在: {img_path}，将跳过。")
-                element_images.append(None)
                 continue
+
+            pos = elem.get("position", {})
+            target_x = int(pos.get("x_px", 0) * scale_x)
+            target_y = int(pos.get("y_px", 0) * scale_y)
+            target_width = int(pos.get("width_px", 100) * scale_x)
+            target_height = int(pos.get("height_px", 100) * scale_y)
+
+            # 确保尺寸为偶数
+            if target_width % 2 != 0:
+                target_width += 1
+            if target_height % 2 != 0:
+                target_height += 1
+
             try:
-                elem_img = Image.open(img_path).convert("RGBA")
-                element_images.append(elem_img)
+                with Image.open(img_path) as probe:
+                    source_width, source_height = probe.size
             except Exception as e:
                 print(f"  ⚠️  无法打开元素图片 {img_path}: {e}")
-                element_images.append(None)
+                continue
+            source_bytes = max(source_bytes, source_width * source_height * 4 * 2)
 
-        # 步骤3：生成每一秒的静态画面（帧）
-        # 重要修改：现在秒数对应的是视频时间，而不是元素索引
-        current_second = 0
-        frame_index = 0
-        
-        # 第0秒：只显示背景（没有元素）
-        print(f"     生成第 {current_second} 秒画面（仅背景）...")
-        current_frame = bg_img.copy()
-        frame_path = temp_frame_dir / f"frame_{frame_index:03d}.png"
-        current_frame.convert("RGB").save(frame_path, "PNG")
-        current_second += 1
-        frame_index += 1
-        
-        # 对于每个元素，生成 element_duration 秒的画面
-        for elem_index in range(len(elements)):
-            print(f"     处理元素 {elem_index+1}（第{current_second/30}秒开始）...")
-            
-            # 为当前元素的每一秒生成画面
-            for duration_step in range(int(element_duration)):
-                # 创建当前背景副本
-                current_frame = bg_img.copy()
-                
-                # 粘贴所有已经出现的元素（包括当前元素）
-                for i in range(elem_index + 1):  # +1 表示包含当前元素
-                    if i >= len(elements):
-                        break
-                    elem_img = element_images[i]
-                    if elem_img is None:
-                        continue
-                    
-                    elem_data = elements[i]
-                    pos = elem_data.get("position", {})
-                    
-                    # 坐标缩放计算（与之前相同）
-                    elem_x_px = pos.get("x_px", 0)
-                    elem_y_px = pos.get("y_px", 0)
-                    elem_width_px = pos.get("width_px", 100)
-                    elem_height_px = pos.get("height_px", 100)
-                    
-                    scale_x = bg_width / 1280.0
-                    scale_y = bg_height / 720.0
-                    
-                    target_x = int(elem_x_px * scale_x)
-                    target_y = int(elem_y_px * scale_y)
-                    target_width = int(elem_width_px * scale_x)
-                    target_height = int(elem_height_px * scale_y)
-                    
-                    # 确保尺寸为偶数
-                    if target_width % 2 != 0:
-                        target_width += 1
-                    if target_height % 2 != 0:
-                        target_height += 1
-                    
-                    resized_elem_img = elem_img.resize((target_width, target_height), Image.Resampling.LANCZOS)
-                    current_frame.paste(resized_elem_img, (target_x, target_y), resized_elem_img)
-                
-                # 保存当前合成帧
-                frame_path = temp_frame_dir / f"frame_{frame_index:03d}.png"
-                current_frame.convert("RGB").save(frame_path, "PNG")
-                frame_index += 1
-            
-            current_second += element_duration
-
-        print(f"     所有画面生成完毕（共{frame_index}帧），开始合成视频...")
-
-        # 步骤4：使用FFmpeg将所有静态帧合成为视频
-        # 注意：现在每帧播放时间不再是固定的1秒，需要调整FFmpeg参数
-        ffmpeg_cmd = [
-            "ffmpeg", "-y",
-            "-framerate", str(fps),  # 输入帧率
-            "-i", str(temp_frame_dir / "frame_%03d.png"),  # 输入图像序列
-            "-c:v", "libx264",
-            "-pix_fmt", "yuv420p",
-            # 关键修改：使用-r指定输出帧率，而不是用-vf fps
-            "-r", str(fps),
-            output_video_path
-        ]
-        
-        result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True, encoding='utf-8', errors='ignore')
-        if result.returncode == 0:
+            sprite = Sprite(partial(IMAGE_CACHE.get, img_path, (target_width, target_height)),
+                            target_x, target_y, size=(target_width, target_height))
+            if timeline is None:
+                # 没有动画时间轴：第 elem_index 个元素在第 1 + elem_index × element_duration 帧开始入场
+                animations.append(Animation(
+                    sprite,
+                    ANIMATION_EFFECT,
+                    start_frame=1 + elem_index * element_duration,
+                    duration_frames=animation_frames
+                ))
+            elif str(elem.get("id")) in timeline:
+                # 按PPT动画时间轴入场（第0帧为纯背景）
+                event = timeline[str(elem.get("id"))]
+                animations.append(Animation(
+                    sprite,
+                    event["effect"],
+                    # 起始偏移不设下限，0 毫秒的动画从第1帧开始
+                    start_frame=1 + int(round(event["start_ms"] * fps / 1000)),
+                    duration_frames=ms_to_frames(event["duration_ms"], fps)
+                ))
+            else:
+                # 没有入场动画的图片从第一帧起就显示
+                animations.append(Animation(sprite, "appear", start_frame=0))
+
+        if timeline is not None:
+            # 最后一个事件结束后再停留 element_duration 帧
+            total_frames = max([1] + [animation.end_frame for animation in animations]) + element_duration
+            print(f"     按PPT动画时间轴：{len(timeline)} 个入场事件，共 {total_frames} 帧")
+
+        # 步骤3：按估算内存登记预算，再逐帧合成并直接送入FFmpeg编码
+        estimated_bytes = estimate_render_bytes(bg_width, bg_height, animations, total_frames) + source_bytes
+        print(f"     估算内存峰值：{estimated_bytes / (1024*1024):.0f} MB")
+        if budget is not None:
+            budget.acquire(estimated_bytes)
+        try:
+            bg_img = Image.open(bg_image_path).convert("RGB")
+            success = render_animation(bg_img, animations, total_frames, output_video_path, fps, on_progress)
+            del bg_img
+        finally:
+            if budget is not None:
+                budget.release(estimated_bytes)
+        if success:
             print(f"  ✅ 幻灯片 {slide_num} 视频生成成功: {output_video_path}")
-            print(f"     视频时长：{total_seconds/30} 秒，帧率：{fps} fps")
-        else:
-            print(f"  ❌ 幻灯片 {slide_num} 视频合成失败:")
-            print(f"     错误信息: {result.stderr[:200]}")
+            print(f"     视频时长：{total_frames/fps} 秒，帧率：{fps} fps")
+            return True
+        print(f"  ❌ 幻灯片 {slide_num} 视频合成失败")
 
     except Exception as e:
         print(f"  ❌ 处理幻灯片 {slide_num} 时发生未知错误: {e}")
-    finally:
-        # 步骤5：清理临时帧文件
-        if temp_frame_dir.exists():
-            for frame_file in temp_frame_dir.glob("*.png"):
-                frame_file.unlink()
-            temp_frame_dir.rmdir()
-
-def generate_all_ppt_videos(json_file_path="extract_pic.json", bg_img_dir="img", output_video_dir="temp/video", fps=30):
+
+def generate_all_ppt_videos(json_file_path="extract_pic.json", bg_img_dir="img", output_video_dir="temp/video", fps=30,
+                            audio_dir="voice", segment_dir="video", workers=RENDER_WORKERS, budget=None):
     """
     主函数：读取JSON，为每张幻灯片生成视频。
     新增可选参数：
         element_duration: 可从此函数传入（如果需要在外部统一控制）
+        audio_dir: 讲稿音频目录（静态快速通道直接封装音频）
+        segment_dir: 带音频单页片段目录；为None时静态页也只输出无声视频（如多分辨率模式）
+        workers: 同时渲染的动画页数上限
+        budget: RenderBudget，默认按 RENDER_MEMORY_MB 创建
     """
     print("=" * 60)
     print("PPT图片动画视频生成器 (调整元素间隔版)")
@@ -190,21 +384,87 @@ def generate_all_ppt_videos(json_file_path="extract_pic.json", bg_img_dir="img",
     print(f"📊 共发现 {len(slides)} 张幻灯片待处理。")
     print("-" * 60)
 
+    # 画面完全相同的页只渲染一次（静态页还要求音频相同，因为直接输出带音频的片段）
+    render_index = DedupIndex("动画去重")
+    static_index = DedupIndex("静态页去重")
+
+    # 整体进度：每页一个单元（复用、跳过的页直接计为完成）
+    deck = DeckProgress("生成单页视频", len(slides))
+
+    # workers > 1 时动画页交给线程池并行渲染（NumPy混合与FFmpeg编码都不持有GIL），
+    # 同时渲染的页数再受内存预算限制
+    if budget is None:
+        budget = RenderBudget(render_budget_bytes())
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    # 画面指纹 -> (渲染任务, 输出路径)；同画面的后续页等它完成后再复用
+    in_flight = {}
+    deferred = []
+
     for slide in slides:
         slide_num = slide.get("slide_number")
         bg_image_path = Path(bg_img_dir) / f"page_{slide_num}.png"
         
         if not bg_image_path.exists():
             print(f"❌ 幻灯片 {slide_num} 的背景图不存在: {bg_image_path}")
+            deck.skip()
+            continue
+        
+        fingerprint = visual_fingerprint(slide, bg_image_path) if DEDUP_SLIDES else None
+        
+        if not slide.get("animated_elements"):
+            create_static_slide_video(slide_num, bg_image_path, output_path, audio_dir, segment_dir, fps,
+                                      dedup_index=static_index, fingerprint=fingerprint,
+                                      on_progress=deck.callback(f"page_{slide_num}"))
+            print("-" * 40)
             continue
         
         output_video_path = output_path / f"page_{slide_num}.mp4"
         
+        if fingerprint and render_index.reuse(fingerprint, str(output_path), f"page_{slide_num}"):
+            print(f"  ♻️  幻灯片 {slide_num} 与之前的页画面相同，直接复用动画视频")
+            deck.skip()
+            print("-" * 40)
+            continue
+        if fingerprint and fingerprint in in_flight:
+            deferred.append((slide, bg_image_path, output_video_path, fingerprint))
+            continue
+        
         # 可以在这里统一设置所有幻灯片的元素间隔
         # 例如，如果想所有幻灯片都使用3秒间隔，可以在这里设置
-        create_video_for_slide(slide, str(bg_image_path), str(output_video_path), fps)
+        on_progress = deck.callback(f"page_{slide_num}")
+        # 每页渲染作为一个任务运行，开启性能分析时按页归属采样栈与FFmpeg耗时
+        task = (f"slide_{slide_num}", create_video_for_slide, slide, str(bg_image_path), str(output_video_path), fps,
+                budget, on_progress)
+        if executor is None:
+            if run_task(*task) and fingerprint:
+                render_index.add(fingerprint, output_video_path)
+            print("-" * 40)
+            continue
+        future = executor.submit(run_task, *task)
+        in_flight[fingerprint or f"page_{slide_num}"] = (future, output_video_path, fingerprint)
+
+    for future, output_video_path, fingerprint in in_flight.values():
+        if future.result() and fingerprint:
+            render_index.add(fingerprint, output_video_path)
+    if executor is not None:
+        executor.shutdown()
+        print("-" * 40)
+
+    for slide, bg_image_path, output_video_path, fingerprint in deferred:
+        slide_num = slide.get("slide_number")
+        if render_index.reuse(fingerprint, str(output_path), f"page_{slide_num}"):
+            print(f"  ♻️  幻灯片 {slide_num} 与之前的页画面相同，直接复用动画视频")
+            deck.skip()
+        elif run_task(f"slide_{slide_num}", create_video_for_slide, slide, str(bg_image_path),
+                      str(output_video_path), fps, budget, deck.callback(f"page_{slide_num}")):
+            render_index.add(fingerprint, output_video_path)
         print("-" * 40)
 
+    render_index.report()
+    budget.report()
+    deck.report()
+    static_index.report()
+    IMAGE_CACHE.report()
     print("=" * 60)
     print("✅ 所有幻灯片处理完成！")
     print(f"   视频文件保存在: {output_video_dir}")
@@ -1,16 +1,36 @@
 import os
 import subprocess
 import re
+import json
+import math
+import hashlib
+import shutil
+import tempfile
 from pathlib import Path
 
 # 从config导入（保持你的原有配置）
-from config import VIDEO_DIR, TEMP_DIR, FFMPEG_PATH, VOICE_DIR
+from config import (VIDEO_DIR, TEMP_DIR, FFMPEG_PATH, VOICE_DIR, OUTPUT_MODE, HLS_DIR,
+                    MERGE_UPDATE, SEGMENT_STORE_DIR, SEGMENT_STORE_MB, DEDUP_SLIDES)
+from ffmpeg_runner import run_ffmpeg, encode_threads, DeckProgress
+from raster_cache import CacheLock
+
+# 单页片段的容器：mp4（AAC音频）或 mov（PCM无损音频，最终合并时才编码AAC）
+SEGMENT_EXTENSIONS = ('.mp4', '.mov')
 
 def extract_page_number(filename):
     """从文件名中提取页码数字"""
-    match = re.search(r'page_(\d+)\.mp4$', filename)
+    match = re.search(r'page_(\d+)\.(?:mp4|mov)$', filename)
     return int(match.group(1)) if match else None
 
+def final_audio_args(video_files):
+    """
+    最终输出的音频参数：片段中已是AAC则直接复制；
+    含PCM片段（mov）时在这里做全流程唯一的一次AAC编码
+    """
+    if any(str(video).endswith('.mov') for video in video_files):
+        return ['-c:a', 'aac', '-b:a', '128k']
+    return ['-c:a', 'copy']
+
 def get_video_duration(input_file):
     """获取视频时长（封装成函数，统一处理编码）"""
     try:
@@ -22,8 +42,9 @@ def get_video_duration(input_file):
             input_file
         ]
         # 关键：指定编码为utf-8，忽略解码错误
-        result = subprocess.run(
+        result = run_ffmpeg(
             cmd, 
+            threads=0,
             capture_output=True, 
             text=True,
             encoding='utf-8',  # 强制UTF-8解码
@@ -43,10 +64,15 @@ def get_video_duration(input_file):
         print(f"获取时长异常: {e}")
         return None
 
-def create_fade_filter(input_file, output_file, fade_duration=1.0):
-    """为单个视频创建渐入渐出效果"""
+def create_fade_filter(input_file, output_file, fade_duration=1.0, duration=None, on_progress=None):
+    """
+    为单个视频创建渐入渐出效果
+    duration: 已知的视频时长，传入时不再重复探测
+    on_progress: 编码进度回调（见 ffmpeg_runner.ProgressTracker）
+    """
     # 获取视频时长（调用封装后的函数）
-    duration = get_video_duration(input_file)
+    if duration is None:
+        duration = get_video_duration(input_file)
     if duration is None:
         return None
     
@@ -64,16 +90,18 @@ def create_fade_filter(input_file, output_file, fade_duration=1.0):
         '-c:v', 'libx264',
         '-preset', 'medium',
         '-crf', '23',
-        '-c:a', 'aac',
-        '-b:a', '128k',
+        '-c:a', 'copy',  # 只处理画面，音频直接复制，避免多一代有损编码
         '-y',  # 覆盖输出文件
         output_file
     ]
     
     print(f"正在为 {os.path.basename(input_file)} 添加渐入渐出效果...")
     # 关键：指定编码，避免解码错误
-    result = subprocess.run(
+    result = run_ffmpeg(
         cmd,
+        threads=encode_threads(),
+        duration=duration,
+        on_progress=on_progress,
         capture_output=True,
         text=True,
         encoding='utf-8',
@@ -87,36 +115,235 @@ def create_fade_filter(input_file, output_file, fade_duration=1.0):
     
     return output_file
 
-def concatenate_videos(video_files, output_file):
-    """拼接多个视频文件"""
+def create_job_temp_dir(prefix="merge_"):
+    """为本次任务创建独立的临时目录，避免并发任务互相覆盖中间文件"""
+    Path(TEMP_DIR).mkdir(parents=True, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=TEMP_DIR)
+
+def get_dir_size(path):
+    """统计目录下所有文件的总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+def build_concat_list(video_files):
+    """
+    生成concat分离器的文件列表内容（使用绝对路径，并转义单引号）
+    路径显式加 file: 前缀：列表经stdin传入时，FFmpeg会把无协议的路径当作 pipe: 的相对路径
+    """
+    lines = []
+    for video in video_files:
+        abs_video = os.path.abspath(video).replace("'", "'\\''")
+        lines.append(f"file 'file:{abs_video}'")
+    return "\n".join(lines) + "\n"
+
+def segment_store_key(video_path, fade_duration=1.0):
+    """计算片段缓存的键：单页视频内容哈希 + 渐入渐出参数"""
+    sha = hashlib.sha256()
+    with open(video_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    sha.update(f"fade={fade_duration}".encode('utf-8'))
+    return sha.hexdigest()
+
+def get_faded_segment(video_path, store_dir=SEGMENT_STORE_DIR, fade_duration=1.0, on_progress=None):
+    """
+    从片段缓存中取出单页的渐入渐出片段，未命中时编码并存入缓存（on_progress 为编码进度回调）
+
+    返回:
+        (str, float, bool): 片段路径, 时长, 是否命中缓存；失败时片段路径为None
+    """
+    Path(store_dir).mkdir(parents=True, exist_ok=True)
+    key = segment_store_key(video_path, fade_duration)
+    extension = os.path.splitext(video_path)[1]
+    segment_file = os.path.join(store_dir, f"{key}{extension}")
+    info_file = os.path.join(store_dir, f"{key}.json")
+
+    if os.path.exists(segment_file) and os.path.exists(info_file):
+        try:
+            with open(info_file, 'r', encoding='utf-8') as f:
+                duration = json.load(f)["duration"]
+            # 刷新最近使用时间，淘汰时按此排序
+            os.utime(segment_file)
+            return segment_file, duration, True
+        except (OSError, ValueError, KeyError):
+            pass
+
+    duration = get_video_duration(video_path)
+    if duration is None:
+        return None, None, False
+
+    # 先写临时文件再改名，避免中断后留下不完整的缓存片段；临时名带进程号，并发合并互不覆盖
+    temp_file = os.path.join(store_dir, f"{key}.{os.getpid()}.part{extension}")
+    if not create_fade_filter(video_path, temp_file, fade_duration, duration=duration, on_progress=on_progress):
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        return None, None, False
+    os.replace(temp_file, segment_file)
+
+    temp_info = os.path.join(store_dir, f"{key}.{os.getpid()}.part.json")
+    with open(temp_info, 'w', encoding='utf-8') as f:
+        json.dump({"duration": duration, "source": os.path.basename(video_path)}, f, ensure_ascii=False)
+    os.replace(temp_info, info_file)
+    return segment_file, duration, False
+
+def evict_segment_store(store_dir=SEGMENT_STORE_DIR, max_bytes=SEGMENT_STORE_MB * 1024 * 1024):
+    """
+    片段缓存超出容量时按最近使用时间（mtime）从旧到新淘汰，片段与其时长信息一起删除；
+    正被其他任务读取而无法删除的片段跳过
+
+    返回:
+        int: 淘汰的片段数
+    """
+    if not os.path.isdir(store_dir):
+        return 0
+    with CacheLock(store_dir):
+        # 内容键 -> [最近使用时间, 字节数, 文件列表]
+        entries = {}
+        for entry in os.scandir(store_dir):
+            # 跳过锁文件和其他任务正在写入的临时文件
+            if entry.name.startswith('.') or '.part' in entry.name:
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            item = entries.setdefault(entry.name.split('.', 1)[0], [0.0, 0, []])
+            item[0] = max(item[0], stat.st_mtime)
+            item[1] += stat.st_size
+            item[2].append(entry.path)
+        total_bytes = sum(size for _, size, _ in entries.values())
+
+        removed = 0
+        for _, size, paths in sorted(entries.values()):
+            if total_bytes <= max_bytes:
+                break
+            try:
+                # 先删片段再删时长信息：中途失败时剩下的信息文件不会被当作命中
+                for path in sorted(paths, key=lambda path: path.endswith('.json')):
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # Windows 上正被读取的片段无法删除，保留到下次淘汰
+                continue
+            total_bytes -= size
+            removed += 1
+
+    if removed:
+        print(f"🗂️  片段缓存超出 {max_bytes / (1024*1024):.0f} MB，已淘汰 {removed} 个片段")
+    return removed
+
+def build_slide_index(page_durations):
+    """
+    根据每页时长计算章节索引（无需再探测最终视频）
+
+    参数:
+        page_durations: [(页码, 时长秒数), ...]，按播放顺序排列
+
+    返回:
+        list: [{"page", "title", "start", "end"}, ...]
+    """
+    chapters = []
+    current_time = 0.0
+    for page_num, duration in page_durations:
+        chapters.append({
+            "page": page_num,
+            "title": f"第{page_num}页",
+            "start": round(current_time, 3),
+            "end": round(current_time + duration, 3)
+        })
+        current_time += duration
+    return chapters
+
+def write_chapter_metadata(chapters, metadata_file):
+    """将章节索引写成FFmpeg的ffmetadata格式，用于生成MP4章节"""
+    def escape(value):
+        return re.sub(r'([=;#\\\n])', r'\\\1', value)
+
+    lines = [";FFMETADATA1"]
+    for chapter in chapters:
+        lines += [
+            "[CHAPTER]",
+            "TIMEBASE=1/1000",
+            f"START={int(round(chapter['start'] * 1000))}",
+            f"END={int(round(chapter['end'] * 1000))}",
+            f"title={escape(chapter['title'])}"
+        ]
+    with open(metadata_file, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    return metadata_file
+
+def write_chapter_index(chapters, output_file):
+    """
+    写出最终视频的章节索引（与视频同名的 .chapters.json），供LMS按页跳转
+
+    返回:
+        str: 索引文件路径
+    """
+    index_file = os.path.splitext(output_file)[0] + ".chapters.json"
+    with open(index_file, 'w', encoding='utf-8') as f:
+        json.dump({
+            "video": os.path.basename(output_file),
+            "duration": chapters[-1]["end"] if chapters else 0,
+            "chapters": chapters
+        }, f, indent=2, ensure_ascii=False)
+    return index_file
+
+def concatenate_videos(video_files, output_file, chapters=None, work_dir=None, on_progress=None):
+    """
+    拼接多个视频文件
+    chapters: 章节索引（见 build_slide_index），传入时写入MP4章节
+    work_dir: 本次任务的临时目录，章节元数据文件写在这里
+    on_progress: 进度回调；有章节索引时以其总时长计算百分比
+    """
     if not video_files:
         print("没有可拼接的视频文件")
         return False
     
-    # 创建临时文件列表（使用绝对路径，避免ffmpeg路径解析错误）
-    list_file = os.path.abspath('concat_list.txt')
-    
-    with open(list_file, 'w', encoding='utf-8') as f:  # 写入时指定UTF-8
-        for video in video_files:
-            # 转义路径中的特殊字符，用绝对路径
-            abs_video = os.path.abspath(video)
-            f.write(f"file '{abs_video}'\n")
+    # 文件列表不落盘，通过stdin传给concat分离器，并发任务之间互不干扰
+    concat_list = build_concat_list(video_files)
+    own_work_dir = work_dir is None and bool(chapters)
+    if own_work_dir:
+        work_dir = create_job_temp_dir("concat_")
     
     # 使用FFmpeg进行拼接
     cmd = [
         'ffmpeg',
         '-f', 'concat',
         '-safe', '0',
-        '-i', list_file,
-        '-c', 'copy',  # 直接复制编码，避免重新编码
+        '-protocol_whitelist', 'file,pipe',
+        '-i', 'pipe:0',
+    ]
+    if chapters:
+        metadata_file = write_chapter_metadata(chapters, os.path.join(work_dir, "chapters.txt"))
+        cmd += [
+            '-f', 'ffmetadata',
+            '-i', metadata_file,
+            '-map', '0',
+            '-map_metadata', '1',
+            '-map_chapters', '1',
+        ]
+    cmd += [
+        '-c:v', 'copy',  # 直接复制编码，避免重新编码
+        *final_audio_args(video_files),
+        '-movflags', '+faststart',  # moov前置，播放器无需下载完整文件即可开始播放
         '-y',
         output_file
     ]
     
     print(f"正在拼接 {len(video_files)} 个视频...")
     # 关键：指定编码
-    result = subprocess.run(
+    result = run_ffmpeg(
         cmd,
+        duration=chapters[-1]["end"] if chapters else None,
+        on_progress=on_progress,
+        input=concat_list,
         capture_output=True,
         text=True,
         encoding='utf-8',
@@ -124,8 +351,8 @@ def concatenate_videos(video_files, output_file):
     )
     
     # 清理临时文件
-    if os.path.exists(list_file):
-        os.remove(list_file)
+    if own_work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
     
     if result.returncode != 0:
         print(f"拼接失败")
@@ -134,25 +361,217 @@ def concatenate_videos(video_files, output_file):
     
     return True
 
-def merge_videos():
+def parse_hls_media_playlist(playlist_file):
+    """
+    解析单页的HLS媒体播放列表
+
+    返回:
+        (str, list): 初始化片段URI, [(片段时长, 片段URI), ...]
+    """
+    init_uri = None
+    segments = []
+    duration = None
+    with open(playlist_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXT-X-MAP:'):
+                match = re.search(r'URI="([^"]+)"', line)
+                if match:
+                    init_uri = match.group(1)
+            elif line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line and not line.startswith('#') and duration is not None:
+                segments.append((duration, line))
+                duration = None
+    return init_uri, segments
+
+def segment_slide_hls(faded_video, page_num, hls_dir=HLS_DIR):
+    """
+    将单页（已加渐入渐出）视频切成一个fMP4分片，分片边界与页边界对齐
+
+    每页使用独立的初始化片段和播放列表（page_N.m3u8），
+    某一页修改后只需重新切这一页，再重写总播放列表即可
+    """
+    Path(hls_dir).mkdir(parents=True, exist_ok=True)
+
+    # 清理该页旧的分片
+    for old_file in Path(hls_dir).glob(f"page_{page_num}_*"):
+        old_file.unlink()
+
+    playlist_file = os.path.join(hls_dir, f"page_{page_num}.m3u8")
+    cmd = [
+        'ffmpeg',
+        '-i', faded_video,
+        '-c:v', 'copy',
+        *final_audio_args([faded_video]),
+        '-f', 'hls',
+        '-hls_segment_type', 'fmp4',
+        '-hls_time', '86400',  # 足够大，保证每页只有一个分片
+        '-hls_list_size', '0',
+        '-hls_playlist_type', 'vod',
+        '-hls_fmp4_init_filename', f"page_{page_num}_init.mp4",
+        '-hls_segment_filename', os.path.join(hls_dir, f"page_{page_num}_%d.m4s"),
+        '-y',
+        playlist_file
+    ]
+
+    result = run_ffmpeg(
+        cmd,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='ignore'
+    )
+
+    if result.returncode != 0:
+        print(f"切片失败: {faded_video}")
+        print(f"错误信息: {result.stderr}")
+        return None
+
+    return playlist_file
+
+def remove_stale_hls_pages(page_nums, hls_dir=HLS_DIR):
+    """
+    删除不属于本次文稿的分页播放列表和分片（如之前更长的文稿遗留的页）
+
+    返回:
+        int: 删除的页数
+    """
+    if not os.path.isdir(hls_dir):
+        return 0
+    keep = set(page_nums)
+    stale = set()
+    for file in os.listdir(hls_dir):
+        match = re.fullmatch(r'page_(\d+)(\.m3u8|_.+)', file)
+        if match and int(match.group(1)) not in keep:
+            stale.add(int(match.group(1)))
+            os.remove(os.path.join(hls_dir, file))
+    if stale:
+        print(f"已清理 {len(stale)} 页遗留的HLS切片: {', '.join(f'page_{num}' for num in sorted(stale))}")
+    return len(stale)
+
+def write_hls_index(hls_dir=HLS_DIR, playlist_name="index.m3u8", pages=None):
+    """
+    根据各页的播放列表生成总播放列表和每页一章的章节索引（chapters.json）
+
+    参数:
+        pages: 只收录这些页码；None 表示收录目录中所有分页播放列表
+
+    返回:
+        str: 总播放列表路径，失败返回None
+    """
+    page_playlists = []
+    for file in os.listdir(hls_dir):
+        match = re.fullmatch(r'page_(\d+)\.m3u8', file)
+        if match and (pages is None or int(match.group(1)) in pages):
+            page_playlists.append((int(match.group(1)), os.path.join(hls_dir, file)))
+    page_playlists.sort()
+
+    if not page_playlists:
+        print(f"在 {hls_dir} 目录中未找到分页播放列表")
+        return None
+
+    entries = []
+    page_durations = []
+    for page_num, playlist_file in page_playlists:
+        init_uri, segments = parse_hls_media_playlist(playlist_file)
+        entries.append((init_uri, segments))
+        page_durations.append((page_num, sum(duration for duration, _ in segments)))
+
+    chapters = build_slide_index(page_durations)
+    for chapter, (_, segments) in zip(chapters, entries):
+        chapter["segments"] = [uri for _, uri in segments]
+
+    target_duration = math.ceil(max(duration for _, segments in entries for duration, _ in segments))
+
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{target_duration}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+    ]
+    for index, (init_uri, segments) in enumerate(entries):
+        # 每页编码参数独立，页与页之间需要声明不连续
+        if index > 0:
+            lines.append("#EXT-X-DISCONTINUITY")
+        if init_uri:
+            lines.append(f'#EXT-X-MAP:URI="{init_uri}"')
+        for duration, uri in segments:
+            lines.append(f"#EXTINF:{duration:.6f},")
+            lines.append(uri)
+    lines.append("#EXT-X-ENDLIST")
+
+    index_file = os.path.join(hls_dir, playlist_name)
+    with open(index_file, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+
+    with open(os.path.join(hls_dir, "chapters.json"), 'w', encoding='utf-8') as f:
+        json.dump({"playlist": playlist_name, "chapters": chapters}, f, indent=2, ensure_ascii=False)
+
+    return index_file
+
+def republish_hls_slide(page_num, hls_dir=HLS_DIR):
+    """
+    重新发布单页：只对修改过的一页重新加渐入渐出并切片，其余页保持不变
+
+    返回:
+        str: 总播放列表路径，失败返回None
+    """
+    candidates = [os.path.abspath(os.path.join(VIDEO_DIR, f"page_{page_num}{ext}")) for ext in SEGMENT_EXTENSIONS]
+    video_path = next((path for path in candidates if os.path.exists(path)), None)
+    if video_path is None:
+        print(f"未找到第{page_num}页的视频文件")
+        return None
+
+    job_dir = create_job_temp_dir("republish_")
+    try:
+        faded_video = create_fade_filter(video_path, os.path.join(job_dir, f"faded_{os.path.basename(video_path)}"))
+        playlist_file = segment_slide_hls(faded_video, page_num, hls_dir) if faded_video else None
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+    if not playlist_file:
+        return None
+
+    index_file = write_hls_index(hls_dir)
+    if index_file:
+        print(f"✅ 第{page_num}页已重新发布: {os.path.abspath(index_file)}")
+    return index_file
+
+def merge_videos(output_mode=OUTPUT_MODE, update=MERGE_UPDATE):
+    """
+    为每页视频添加渐入渐出效果后输出最终视频
+
+    参数:
+        output_mode: mp4（拼接为final_video.mp4）、hls（按页切片）、both（两者都输出）
+        update: 增量模式，渐入渐出片段保存在片段缓存中，只重新编码内容变化的页
+
+    返回:
+        (bool, str): 是否成功, 最终视频路径（hls模式下为总播放列表路径）
+    """
+    if output_mode not in ("mp4", "hls", "both"):
+        print(f"未知的输出形式: {output_mode}")
+        return False, None
+
     # 设置目录和文件（优先使用config中的TEMP_DIR，避免重复定义）
     OUTPUT_FILE = './final_video.mp4'
-    # 优先使用config中的TEMP_DIR，没有则用临时目录
-    temp_dir = TEMP_DIR
-    # temp_dir = TEMP_DIR if 'TEMP_DIR' in locals() else './temp_faded_videos'
     
     # 确保目录存在
     Path(VIDEO_DIR).mkdir(parents=True, exist_ok=True)
-    Path(temp_dir).mkdir(parents=True, exist_ok=True)
+    # 每次任务使用TEMP_DIR下独立的临时目录，并发任务互不覆盖
+    temp_dir = create_job_temp_dir()
+    peak_temp_bytes = 0
     
-    # 获取所有page_*.mp4文件（转绝对路径，避免相对路径问题）
+    # 获取所有page_*.mp4 / page_*.mov文件（转绝对路径，避免相对路径问题）
     video_files = []
     for file in os.listdir(VIDEO_DIR):
-        if file.endswith('.mp4') and file.startswith('page_'):
+        if file.endswith(SEGMENT_EXTENSIONS) and file.startswith('page_'):
             video_files.append(os.path.abspath(os.path.join(VIDEO_DIR, file)))
     
     if not video_files:
         print(f"在 {VIDEO_DIR} 目录中未找到 page_*.mp4 文件")
+        shutil.rmtree(temp_dir, ignore_errors=True)
         return False, None
     
     # 按页码排序（基于文件名提取）
@@ -162,32 +581,102 @@ def merge_videos():
     for vf in video_files:
         print(f"  - {os.path.basename(vf)}")
     
+    # 整体进度：每页的渐入渐出各一个单元，拼接一个单元
+    deck = DeckProgress("合并视频", len(video_files) + (1 if output_mode in ("mp4", "both") else 0))
+    
     # 处理每个视频，添加渐入渐出效果
+    # 时长只探测一次，同时用于渐入渐出和章节索引
     faded_videos = []
+    page_durations = []
+    reused_count = 0
+    # 内容完全相同的页只做一次渐入渐出，拼接时重复引用同一个片段
+    faded_by_content = {}
     for video_path in video_files:
         video_filename = os.path.basename(video_path)
-        output_path = os.path.join(temp_dir, f"faded_{video_filename}")
+        content_key = segment_store_key(video_path) if DEDUP_SLIDES and not update else None
         
-        faded_video = create_fade_filter(video_path, output_path)
+        if content_key in faded_by_content:
+            faded_video, duration = faded_by_content[content_key]
+            print(f"复用内容相同的片段: {video_filename}")
+            deck.skip()
+        elif update:
+            faded_video, duration, hit = get_faded_segment(video_path, on_progress=deck.callback(video_filename))
+            if hit:
+                reused_count += 1
+                print(f"复用未变化的片段: {video_filename}")
+                deck.skip()
+        else:
+            output_path = os.path.join(temp_dir, f"faded_{video_filename}")
+            duration = get_video_duration(video_path)
+            if duration is None:
+                deck.skip()
+                continue
+            faded_video = create_fade_filter(video_path, output_path, duration=duration,
+                                             on_progress=deck.callback(video_filename))
+            peak_temp_bytes = max(peak_temp_bytes, get_dir_size(temp_dir))
+            if faded_video and content_key:
+                faded_by_content[content_key] = (faded_video, duration)
         if faded_video:
             faded_videos.append(faded_video)
+            page_durations.append((extract_page_number(video_filename), duration))
     
     if not faded_videos:
         print("没有成功处理的视频")
+        shutil.rmtree(temp_dir, ignore_errors=True)
         return False, None
     
+    if update:
+        print(f"增量合并：复用 {reused_count} 页，重新编码 {len(faded_videos) - reused_count} 页")
+    
+    # 按页切片（HLS）
+    index_file = None
+    if output_mode in ("hls", "both"):
+        print(f"正在按页切片 {len(faded_videos)} 个视频...")
+        page_nums = [page_num for page_num, _ in page_durations]
+        # 总播放列表只收录本次的页，之前更长的文稿遗留的分页先删除
+        remove_stale_hls_pages(page_nums)
+        hls_ok = True
+        for faded_video, page_num in zip(faded_videos, page_nums):
+            if not segment_slide_hls(faded_video, page_num):
+                hls_ok = False
+        index_file = write_hls_index(pages=set(page_nums)) if hls_ok else None
+        if index_file:
+            print(f"✅ HLS播放列表已保存为: {os.path.abspath(index_file)}")
+
     # 拼接所有处理后的视频
-    success = concatenate_videos(faded_videos, OUTPUT_FILE)
+    if output_mode in ("mp4", "both"):
+        chapters = build_slide_index(page_durations)
+        success = concatenate_videos(faded_videos, OUTPUT_FILE, chapters=chapters, work_dir=temp_dir,
+                                     on_progress=deck.callback(os.path.basename(OUTPUT_FILE)))
+        deck.report()
+        peak_temp_bytes = max(peak_temp_bytes, get_dir_size(temp_dir))
+        if success:
+            index_path = write_chapter_index(chapters, OUTPUT_FILE)
+            print(f"章节索引已保存为: {os.path.abspath(index_path)}")
+    else:
+        success = index_file is not None
     
-    # 清理临时文件
+    # 片段缓存容量控制只是尽力而为，其他任务长时间占用缓存锁时留到下次再清理
+    if update:
+        try:
+            evict_segment_store()
+        except OSError as e:
+            print(f"⚠️  跳过片段缓存清理: {e}")
+    
+    # 清理临时文件（增量模式下片段保留在缓存中，不计入临时占用）
     print("清理临时文件...")
-    for temp_video in faded_videos:
-        if os.path.exists(temp_video):
-            os.remove(temp_video)
+    print(f"临时文件峰值占用: {peak_temp_bytes / (1024*1024):.2f} MB")
+    shutil.rmtree(temp_dir, ignore_errors=True)
     
-    if os.path.exists(temp_dir) and not os.listdir(temp_dir):
-        os.rmdir(temp_dir)
+    if os.path.exists(TEMP_DIR) and not os.listdir(TEMP_DIR):
+        os.rmdir(TEMP_DIR)
     
+    if output_mode == "hls":
+        if success:
+            return True, os.path.abspath(index_file)
+        print("\n❌ 视频处理失败")
+        return False, None
+
     if success and os.path.exists(OUTPUT_FILE):
         file_size = os.path.getsize(OUTPUT_FILE) / (1024*1024)
         print(f"\n✅ 视频处理完成！最终视频已保存为: {os.path.abspath(OUTPUT_FILE)}")
@@ -201,15 +690,17 @@ def check_ffmpeg_installed():
     """检查FFmpeg是否已安装"""
     try:
         # 指定编码，避免检查时的解码错误
-        subprocess.run(
+        run_ffmpeg(
             ['ffmpeg', '-version'], 
+            threads=0,
             capture_output=True, 
             check=True,
             encoding='utf-8',
             errors='ignore'
         )
-        subprocess.run(
+        run_ffmpeg(
             ['ffprobe', '-version'], 
+            threads=0,
             capture_output=True, 
             check=True,
             encoding='utf-8',
@@ -1,88 +1,228 @@
 # -*- coding:utf-8 -*-
 
-import websocket
-import hashlib
 import base64
-import hmac
 import json
-from urllib.parse import urlencode
-import ssl
-from wsgiref.handlers import format_date_time
-from datetime import datetime
-from time import mktime
-import _thread as thread
 import os
 import glob
 import time
-from config import XUNFEI_APP_ID, XUNFEI_API_KEY, XUNFEI_API_SECRET, SCRIPT_DIR, VOICE_DIR
-
-class AssembleHeaderException(Exception):
-    def __init__(self, msg):
-        self.message = msg
-
-class Url:
-    def __init__(self, host, path, schema):
-        self.host = host
-        self.path = path
-        self.schema = schema
-
-def parse_url(request_url):
-    stidx = request_url.index("://")
-    host = request_url[stidx + 3:]
-    schema = request_url[:stidx + 3]
-    edidx = host.index("/")
-    if edidx <= 0:
-        raise AssembleHeaderException("invalid request url:" + request_url)
-    path = host[edidx:]
-    host = host[:edidx]
-    return Url(host, path, schema)
-
-def assemble_ws_auth_url(request_url, method="GET", api_key="", api_secret=""):
-    """生成带鉴权的WebSocket URL"""
-    u = parse_url(request_url)
-    host = u.host
-    path = u.path
-    
-    now = datetime.now()
-    date = format_date_time(mktime(now.timetuple()))
-    
-    signature_origin = f"host: {host}\ndate: {date}\n{method} {path} HTTP/1.1"
-    signature_sha = hmac.new(
-        api_secret.encode('utf-8'), 
-        signature_origin.encode('utf-8'),
-        digestmod=hashlib.sha256
-    ).digest()
-    signature_sha = base64.b64encode(signature_sha).decode(encoding='utf-8')
-    
-    authorization_origin = (
-        f'api_key="{api_key}", algorithm="hmac-sha256", '
-        f'headers="host date request-line", signature="{signature_sha}"'
-    )
-    authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode(encoding='utf-8')
-    
-    values = {
-        "host": host,
-        "date": date,
-        "authorization": authorization
-    }
-    
-    return request_url + "?" + urlencode(values)
+import threading
+import subprocess
+import wave
+import sys
+import queue
+from abc import ABC, abstractmethod
+from array import array
+from config import (XUNFEI_APP_ID, XUNFEI_API_KEY, XUNFEI_API_SECRET, XUNFEI_TTS_URL, SCRIPT_DIR, VOICE_DIR,
+                    TTS_AUDIO_FORMAT, TTS_BATCH_SIZE, DEDUP_SLIDES)
+from slide_dedup import DedupIndex
+from ffmpeg_runner import FFmpegProcess
+from tts_session import SignedUrlCache, XunfeiTTSSession
+
+# PCM模式下服务端返回的音频参数
+PCM_SAMPLE_RATE = 24000
+PCM_CHANNELS = 1
+PCM_SAMPLE_WIDTH = 2
+
+# 批量合成时插入页与页之间的停顿标记（1秒），用于在返回的音频中定位分页点
+BATCH_BREAK_MARK = "[p1000]"
+
+class AudioSink(ABC):
+    """
+    音频输出接口：合成过程中每收到一块音频就立即转交，不在内存中缓存整页
+
+    open() 在发送请求前调用，write(chunk) 在每块音频到达时调用，
+    close(success) 在合成结束后调用；子类必须实现 write，否则创建时即报错
+    """
+
+    def open(self):
+        pass
+
+    @abstractmethod
+    def write(self, chunk):
+        """接收一块音频数据"""
+
+    def close(self, success):
+        pass
+
+class FileAudioSink(AudioSink):
+    """边收边写文件：先写入 .part 临时文件，成功后再改名，失败则删除"""
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.part_path = output_path + ".part"
+        self.file = None
+
+    def open(self):
+        self.file = open(self.part_path, 'wb')
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def close(self, success):
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        if success:
+            os.replace(self.part_path, self.output_path)
+        elif os.path.exists(self.part_path):
+            os.remove(self.part_path)
+
+class WavFileAudioSink(FileAudioSink):
+    """边收边写WAV文件：原始PCM块直接追加为音频帧，关闭时补全WAV头"""
+
+    def __init__(self, output_path, sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS, sample_width=PCM_SAMPLE_WIDTH):
+        super().__init__(output_path)
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+
+    def open(self):
+        self.file = wave.open(self.part_path, 'wb')
+        self.file.setnchannels(self.channels)
+        self.file.setsampwidth(self.sample_width)
+        self.file.setframerate(self.sample_rate)
+
+    def write(self, chunk):
+        self.file.writeframesraw(chunk)
+
+class MemoryAudioSink(AudioSink):
+    """将整段音频收集在内存中（批量合成后需要整体切分时使用）"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def open(self):
+        self.data = bytearray()
+
+    def write(self, chunk):
+        self.data += chunk
+
+class RingBufferAudioSink(AudioSink):
+    """
+    内存环形缓冲区：下游线程通过 read() 边合成边消费
+
+    缓冲区写满时 write() 阻塞等待下游读取，内存占用不超过 capacity
+    """
+
+    def __init__(self, capacity=1024 * 1024):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.read_pos = 0
+        self.size = 0
+        self.closed = False
+        self.success = False
+        self.condition = threading.Condition()
+
+    def open(self):
+        with self.condition:
+            self.read_pos = 0
+            self.size = 0
+            self.closed = False
+            self.success = False
+
+    def write(self, chunk):
+        view = memoryview(chunk)
+        while view:
+            with self.condition:
+                while self.size == self.capacity and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                write_pos = (self.read_pos + self.size) % self.capacity
+                count = min(len(view), self.capacity - self.size, self.capacity - write_pos)
+                self.buffer[write_pos:write_pos + count] = view[:count]
+                self.size += count
+                self.condition.notify_all()
+            view = view[count:]
+
+    def read(self, max_bytes=65536, timeout=None):
+        """读取最多 max_bytes 字节；缓冲区已关闭且读空时返回 b''"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.size > 0 or self.closed, timeout):
+                return None
+            count = min(max_bytes, self.size, self.capacity - self.read_pos)
+            data = bytes(self.buffer[self.read_pos:self.read_pos + count])
+            self.read_pos = (self.read_pos + count) % self.capacity
+            self.size -= count
+            self.condition.notify_all()
+            return data
+
+    def close(self, success):
+        with self.condition:
+            self.closed = True
+            self.success = success
+            self.condition.notify_all()
+
+class FFmpegStdinSink(AudioSink):
+    """将音频块直接写入FFmpeg的标准输入，由FFmpeg边收边转码/封装"""
+
+    def __init__(self, output_path, input_format="mp3", output_args=None, input_args=None):
+        self.output_path = output_path
+        self.input_format = input_format
+        self.output_args = output_args or []
+        # 原始PCM输入需要声明采样参数，如 ["-ar", "24000", "-ac", "1"]
+        self.input_args = input_args or []
+        self.process = None
+
+    def open(self):
+        cmd = [
+            "ffmpeg", "-y",
+            "-f", self.input_format,
+            *self.input_args,
+            "-i", "pipe:0",
+            *self.output_args,
+            self.output_path
+        ]
+        # 音频转码很轻，进程却要等待整页音频流式到达，不占CPU槽位，只限定为单线程
+        self.process = FFmpegProcess(cmd, threads=1, slots=0,
+                                     stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def write(self, chunk):
+        self.process.stdin.write(chunk)
+
+    def close(self, success):
+        if self.process is None:
+            return
+        # communicate() 会自行关闭stdin；先手动关闭再调用会在 flush 时抛出 ValueError
+        _, stderr = self.process.communicate()
+        if self.process.returncode != 0:
+            print(f"FFmpeg处理音频失败: {stderr.decode('utf-8', errors='ignore')[-200:]}")
+        if not success or self.process.returncode != 0:
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+        self.process = None
 
 class XunfeiTTSSynthesizer:
     """讯飞TTS合成器"""
     
-    def __init__(self, app_id, api_key, api_secret, output_dir):
+    def __init__(self, app_id, api_key, api_secret, output_dir, ws_url=XUNFEI_TTS_URL, audio_format=TTS_AUDIO_FORMAT):
         self.app_id = app_id
         self.api_key = api_key
         self.api_secret = api_secret
         self.output_dir = output_dir
-        self.ws_url = 'wss://cbm01.cn-huabei-1.xf-yun.com/v1/private/mcd9m97e6'
+        self.ws_url = ws_url
+        # mp3：服务端返回MP3（lame）；pcm：返回原始PCM，保存为WAV
+        self.audio_format = audio_format
+        self.file_extension = ".wav" if audio_format == "pcm" else ".mp3"
+        # 每页首字节延迟（毫秒）：从发送请求到收到第一块音频
+        self.first_byte_latency = {}
+        # 跨页复用的会话（签名URL缓存 + 长连接）
+        self.session = XunfeiTTSSession(SignedUrlCache(self.ws_url, self.api_key, self.api_secret))
         
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
     
-    def _prepare_request_data(self, text, voice="x5_lingyuyan_flow"):
-        """准备请求数据"""
+    def close(self):
+        """关闭会话连接"""
+        self.session.close()
+    
+    def _prepare_request_data(self, text, voice="x5_lingyuyan_flow", audio_format=None):
+        """
+        准备请求数据
+        audio_format: 覆盖本次请求的音频格式（mp3 / pcm），默认使用合成器的设置
+        """
+        audio_format = audio_format or self.audio_format
         common_args = {"app_id": self.app_id, "status": 2}
         
         business_args = {
@@ -96,10 +236,10 @@ class XunfeiTTSSynthesizer:
                 "reg": 0,
                 "rdn": 0,
                 "audio": {
-                    "encoding": "lame",
-                    "sample_rate": 24000,
-                    "channels": 1,
-                    "bit_depth": 16,
+                    "encoding": "raw" if audio_format == "pcm" else "lame",
+                    "sample_rate": PCM_SAMPLE_RATE,
+                    "channels": PCM_CHANNELS,
+                    "bit_depth": PCM_SAMPLE_WIDTH * 8,
                     "frame_size": 0
                 }
             }
@@ -118,94 +258,281 @@ class XunfeiTTSSynthesizer:
         
         return common_args, business_args, data
     
-    def _on_message(self, ws, message, audio_data, is_success):
-        """WebSocket消息回调"""
+    def _on_message(self, message, sink, state):
+        """
+        处理一条服务端消息：音频块到达后立即写入sink
+
+        返回:
+            bool: 本次合成是否已结束
+        """
         try:
             message = json.loads(message)
             code = message["header"]["code"]
             
+            if code != 0:
+                print(f"错误代码: {code}, 消息: {message.get('header', {}).get('message', '未知错误')}")
+                state["error"] = True
+                return True
+            
             if "payload" in message and "audio" in message["payload"]:
                 audio_base64 = message["payload"]["audio"]["audio"]
                 audio_chunk = base64.b64decode(audio_base64)
-                audio_data.append(audio_chunk)
+                if audio_chunk:
+                    if state["first_byte_at"] is None:
+                        state["first_byte_at"] = time.perf_counter()
+                    sink.write(audio_chunk)
+                    state["bytes"] += len(audio_chunk)
                 
                 status = message["payload"]["audio"]["status"]
                 if status == 2:
-                    ws.close()
+                    state["done"] = True
+                    return True
             
-            if code != 0:
-                print(f"错误代码: {code}, 消息: {message.get('header', {}).get('message', '未知错误')}")
-                is_success[0] = False
-            else:
-                is_success[0] = True
+            return False
                 
         except Exception as e:
             print(f"解析消息异常: {e}")
-            is_success[0] = False
-    
-    def _on_error(self, ws, error):
-        """WebSocket错误回调"""
-        print(f"WebSocket错误: {error}")
-    
-    def _on_close(self, ws, close_status_code, close_msg):
-        """WebSocket关闭回调"""
-        pass
-    
-    def _on_open(self, ws, request_data):
-        """WebSocket打开回调"""
-        def run():
-            ws.send(request_data)
-        thread.start_new_thread(run, ())
+            state["error"] = True
+            return True
     
-    def synthesize_text(self, text, output_filename, voice="x5_lingyuyan_flow"):
-        """合成单段文本"""
+    def synthesize_text(self, text, output_filename, voice="x5_lingyuyan_flow", sink=None, audio_format=None):
+        """
+        合成单段文本
+        sink: 音频输出（AudioSink），默认边收边写入 output_dir/output_filename
+              （PCM模式下写为WAV文件）
+        audio_format: 覆盖本次请求的音频格式（mp3 / pcm）
+        """
         # 准备数据
-        common_args, business_args, data = self._prepare_request_data(text, voice)
+        audio_format = audio_format or self.audio_format
+        common_args, business_args, data = self._prepare_request_data(text, voice, audio_format)
         request_data = json.dumps({
             "header": common_args,
             "parameter": business_args,
             "payload": data
         })
         
-        # 生成鉴权URL
-        auth_url = assemble_ws_auth_url(
-            self.ws_url, "GET", self.api_key, self.api_secret
-        )
-        
         # 初始化状态变量
-        audio_data = []
-        is_success = [False]
+        output_path = os.path.join(self.output_dir, output_filename)
+        if sink is None:
+            sink = WavFileAudioSink(output_path) if audio_format == "pcm" else FileAudioSink(output_path)
+        state = {"first_byte_at": None, "bytes": 0, "done": False, "error": False}
         
-        # 创建WebSocket连接
-        ws = websocket.WebSocketApp(
-            auth_url,
-            on_message=lambda ws, msg: self._on_message(ws, msg, audio_data, is_success),
-            on_error=self._on_error,
-            on_close=self._on_close
-        )
-        ws.on_open = lambda ws: self._on_open(ws, request_data)
+        sink.open()
+        success = False
+        sent_at = None
+        try:
+            sent_at = self.session.request(request_data, lambda msg: self._on_message(msg, sink, state))
+            success = state["done"] and state["bytes"] > 0 and not state["error"]
+        except Exception as e:
+            print(f"WebSocket错误: {e}")
+        finally:
+            sink.close(success)
         
-        # 运行WebSocket
-        websocket.enableTrace(False)
-        ws.run_forever(sslopt={"cert_reqs": ssl.CERT_NONE})
+        if sent_at is not None and state["first_byte_at"] is not None:
+            latency_ms = (state["first_byte_at"] - sent_at) * 1000
+            self.first_byte_latency[output_filename] = latency_ms
+            print(f"首字节延迟: {latency_ms:.0f} ms")
         
-        # 保存音频文件
-        if audio_data and is_success[0]:
-            output_path = os.path.join(self.output_dir, output_filename)
-            with open(output_path, 'wb') as f:
-                for chunk in audio_data:
-                    f.write(chunk)
-            print(f"音频文件已保存: {output_path}")
+        if success:
+            print(f"音频文件已保存: {output_path}" if isinstance(sink, FileAudioSink) else f"音频已输出: {output_filename}")
             return True
         else:
             print(f"合成失败: {output_filename}")
             return False
-def synthesize_voices(voice="x5_lingyuyan_flow"):
+
+def split_pcm_on_breaks(pcm, weights, sample_rate=PCM_SAMPLE_RATE, window_ms=10, silence_level=300, min_gap_ms=200):
+    """
+    在整批合成的PCM音频中找到页与页之间的停顿，按采样点精确切分
+
+    参数:
+        pcm: 16位单声道PCM字节
+        weights: 每页的文本长度，用于校验切分结果是否合理
+        silence_level: 判定为静音的最大振幅
+        min_gap_ms: 可作为分页点的最短静音时长
+
+    返回:
+        list: 每页的 (起始采样点, 结束采样点)，无法可靠切分时返回None
+    """
+    samples = array('h')
+    samples.frombytes(pcm[:len(pcm) - len(pcm) % 2])
+    if sys.byteorder == 'big':
+        samples.byteswap()
+
+    page_count = len(weights)
+    if page_count == 1:
+        return [(0, len(samples))]
+
+    # 以窗口为单位找出所有足够长的静音段（首尾的静音不能作为分页点）
+    window = sample_rate * window_ms // 1000
+    min_windows = max(1, min_gap_ms // window_ms)
+    gaps = []
+    run_start = None
+    for index in range(len(samples) // window):
+        chunk = samples[index * window:(index + 1) * window]
+        if max(chunk) <= silence_level and -min(chunk) <= silence_level:
+            if run_start is None:
+                run_start = index
+        else:
+            if run_start is not None and run_start > 0 and index - run_start >= min_windows:
+                gaps.append((index - run_start, run_start * window, index * window))
+            run_start = None
+
+    if len(gaps) < page_count - 1:
+        return None
+
+    # 插入的停顿标记是整段音频中最长的几处静音，切在静音正中
+    breaks = sorted(gaps, reverse=True)[:page_count - 1]
+    cuts = sorted((start + end) // 2 for _, start, end in breaks)
+    bounds = [0] + cuts + [len(samples)]
+    segments = list(zip(bounds[:-1], bounds[1:]))
+
+    # 校验：每页时长与文本长度的比例不应相差太多
+    total_weight = sum(weights)
+    for (start, end), weight in zip(segments, weights):
+        expected = len(samples) * weight / total_weight
+        if not expected / 4 <= end - start <= expected * 4:
+            return None
+    return segments
+
+def write_wav(output_path, pcm, sample_rate=PCM_SAMPLE_RATE, channels=PCM_CHANNELS, sample_width=PCM_SAMPLE_WIDTH):
+    """将PCM字节写为WAV文件（先写临时文件再改名）"""
+    part_path = output_path + ".part"
+    with wave.open(part_path, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(sample_width)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    os.replace(part_path, output_path)
+
+def remove_stale_voice(page_stem, keep_extension):
+    """清理切换音频格式前遗留的另一种格式文件"""
+    for stale_ext in (".mp3", ".wav"):
+        stale_file = os.path.join(VOICE_DIR, page_stem + stale_ext)
+        if stale_ext != keep_extension and os.path.exists(stale_file):
+            os.remove(stale_file)
+
+def synthesize_batch(synthesizer, pages, voice="x5_lingyuyan_flow"):
+    """
+    多页讲稿合并为一次合成请求，再按停顿在本地切分为 page_N.wav
+
+    参数:
+        pages: [(页面文件名主干, 讲稿文本), ...]
+
+    返回:
+        bool: 是否成功（失败时调用方应逐页重试）
+    """
+    text = BATCH_BREAK_MARK.join(page_text for _, page_text in pages)
+    sink = MemoryAudioSink()
+    batch_name = f"{pages[0][0]}~{pages[-1][0]}"
+    print(f"正在批量合成: {batch_name} (共 {len(pages)} 页, 长度: {len(text)} 字符)")
+
+    if not synthesizer.synthesize_text(text, batch_name, voice=voice, sink=sink, audio_format="pcm"):
+        return False
+
+    pcm = bytes(sink.data)
+    segments = split_pcm_on_breaks(pcm, [len(page_text) for _, page_text in pages])
+    if segments is None:
+        print(f"无法在 {batch_name} 中找到可靠的分页停顿")
+        return False
+
+    for (page_stem, _), (start, end) in zip(pages, segments):
+        output_path = os.path.join(synthesizer.output_dir, f"{page_stem}.wav")
+        write_wav(output_path, pcm[start * PCM_SAMPLE_WIDTH:end * PCM_SAMPLE_WIDTH])
+        remove_stale_voice(page_stem, ".wav")
+        print(f"合成成功: {page_stem}.wav ({(end - start) / PCM_SAMPLE_RATE:.3f} 秒)")
+    return True
+
+class TTSQueueWorker:
+    """
+    后台语音合成队列：讲稿每完成一页就入队，由后台线程立即合成，
+    使AI讲稿生成与语音合成并行进行
+    """
+
+    def __init__(self, voice="x5_lingyuyan_flow"):
+        self.voice = voice
+        self.synthesizer = XunfeiTTSSynthesizer(
+            app_id=XUNFEI_APP_ID,
+            api_key=XUNFEI_API_KEY,
+            api_secret=XUNFEI_API_SECRET,
+            output_dir=VOICE_DIR
+        )
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.failed_pages = []
+        self.done_pages = []
+        # 讲稿相同的页只合成一次：{讲稿: 代表页页码}, [(重复页页码, 讲稿)]
+        self.first_pages = {}
+        self.duplicate_pages = []
+        self.voice_index = DedupIndex("语音去重")
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, page_num, text):
+        """讲稿完成回调：把一页讲稿送入合成队列"""
+        text = text.strip()
+        if not text:
+            print(f"警告: 第{page_num}页讲稿为空，跳过")
+            return
+        if DEDUP_SLIDES and text in self.first_pages:
+            print(f"第{page_num}页讲稿与第{self.first_pages[text]}页相同，合成后直接复用")
+            self.duplicate_pages.append((page_num, text))
+            return
+        self.first_pages.setdefault(text, page_num)
+        self.queue.put((page_num, text))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            page_num, text = item
+            page_stem = f"page_{page_num}"
+            base_name = page_stem + self.synthesizer.file_extension
+            print(f"正在合成: {base_name} (长度: {len(text)} 字符)")
+            try:
+                success = self.synthesizer.synthesize_text(text, base_name, voice=self.voice)
+            except Exception as e:
+                print(f"合成过程中发生异常: {e}")
+                success = False
+            if success:
+                remove_stale_voice(page_stem, self.synthesizer.file_extension)
+                self.done_pages.append(page_num)
+                self.voice_index.add(text, os.path.join(VOICE_DIR, base_name))
+            else:
+                self.failed_pages.append(page_num)
+            # 为避免API限制，添加短暂延迟
+            time.sleep(1)
+
+    def finish(self):
+        """
+        等待队列中的讲稿全部合成完毕
+
+        返回:
+            bool: 是否至少合成了一页且没有失败
+        """
+        self.queue.put(None)
+        self.thread.join()
+        self.synthesizer.close()
+        for page_num, text in self.duplicate_pages:
+            page_stem = f"page_{page_num}"
+            if self.voice_index.reuse(text, VOICE_DIR, page_stem):
+                remove_stale_voice(page_stem, self.synthesizer.file_extension)
+                self.done_pages.append(page_num)
+            else:
+                self.failed_pages.append(page_num)
+        self.voice_index.report()
+        print(f"语音合成完成: 成功 {len(self.done_pages)} 页，失败 {len(self.failed_pages)} 页")
+        return bool(self.done_pages) and not self.failed_pages
+
+def synthesize_voices(voice="x5_lingyuyan_flow", batch_size=TTS_BATCH_SIZE):
     """
     合成SCRIPT_DIR目录下所有txt文件的语音
     
     Args:
         voice: 发音人，默认使用"x5_lingyuyan_flow"
+        batch_size: 每次合成请求包含的页数，大于1时按停顿切分为 page_N.wav
     
     Returns:
         bool: 是否全部合成成功
@@ -236,8 +563,9 @@ def synthesize_voices(voice="x5_lingyuyan_flow"):
         
         print(f"找到 {len(txt_files)} 个文本文件")
         
-        # 依次处理每个文件
+        # 读取所有讲稿
         all_success = True
+        pages = []
         
         for txt_file in txt_files:
             # 读取文件内容
@@ -253,15 +581,52 @@ def synthesize_voices(voice="x5_lingyuyan_flow"):
                 print(f"警告: {txt_file} 内容为空，跳过")
                 continue
             
+            pages.append((os.path.splitext(os.path.basename(txt_file))[0], text_content))
+        
+        # 讲稿相同的页只合成一次，其余页在合成后复制
+        duplicate_pages = []
+        if DEDUP_SLIDES:
+            unique_pages = []
+            seen_texts = set()
+            for page_stem, text_content in pages:
+                if text_content in seen_texts:
+                    duplicate_pages.append((page_stem, text_content))
+                else:
+                    seen_texts.add(text_content)
+                    unique_pages.append((page_stem, text_content))
+            pages = unique_pages
+        
+        # 只登记本次合成成功的代表页，失败页在磁盘上遗留的旧音频不能复制给重复页
+        voice_index = DedupIndex("语音去重")
+        
+        # 批量合成：多页一次请求，失败的批次退回逐页合成
+        pending = pages
+        if batch_size > 1:
+            pending = []
+            for start in range(0, len(pages), batch_size):
+                batch = pages[start:start + batch_size]
+                if len(batch) == 1 or not synthesize_batch(synthesizer, batch, voice):
+                    pending.extend(batch)
+                else:
+                    for page_stem, text_content in batch:
+                        voice_index.add(text_content, os.path.join(VOICE_DIR, page_stem + ".wav"))
+                # 为避免API限制，添加短暂延迟
+                time.sleep(1)
+        
+        # 逐页合成；开启批量时也合成为wav，与批量切分的页格式一致，避免合并时混用pcm与AAC音轨
+        page_format = "pcm" if batch_size > 1 else None
+        page_extension = ".wav" if batch_size > 1 else synthesizer.file_extension
+        for page_stem, text_content in pending:
             # 生成输出文件名
-            base_name = os.path.basename(txt_file).replace('.txt', '.mp3')
+            base_name = page_stem + page_extension
             print(f"正在合成: {base_name} (长度: {len(text_content)} 字符)")
             
             # 合成语音
             success = synthesizer.synthesize_text(
                 text=text_content,
                 output_filename=base_name,
-                voice=voice
+                voice=voice,
+                audio_format=page_format
             )
             
             if not success:
@@ -269,13 +634,32 @@ def synthesize_voices(voice="x5_lingyuyan_flow"):
                 print(f"合成失败: {base_name}")
             else:
                 print(f"合成成功: {base_name}")
+                remove_stale_voice(page_stem, page_extension)
+                voice_index.add(text_content, os.path.join(VOICE_DIR, base_name))
             
             # 为避免API限制，添加短暂延迟
-            import time
             time.sleep(1)
         
+        # 复制重复页的语音（代表页可能是mp3或批量合成的wav）
+        for page_stem, text_content in duplicate_pages:
+            output_path = voice_index.reuse(text_content, VOICE_DIR, page_stem)
+            if output_path:
+                remove_stale_voice(page_stem, os.path.splitext(output_path)[1])
+            else:
+                all_success = False
+                print(f"合成失败: {page_stem}（讲稿相同的代表页未合成成功）")
+        voice_index.report()
+        
+        if synthesizer.first_byte_latency:
+            latencies = list(synthesizer.first_byte_latency.values())
+            print(f"首字节延迟: 平均 {sum(latencies) / len(latencies):.0f} ms，最大 {max(latencies):.0f} ms")
+        
+        stats = synthesizer.session.stats()
+        print(f"连接握手 {stats['handshakes']} 次（平均 {stats['handshake_ms_avg']:.0f} ms），复用连接 {stats['reused']} 次")
+        synthesizer.close()
+        
         return all_success
         
     except Exception as e:
         print(f"合成过程中发生异常: {e}")
-        return False
\ No newline at end of file
+        return False